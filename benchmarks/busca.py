@@ -0,0 +1,127 @@
+# Benchmark de latência e recall da busca vetorial: Chroma x índice NumPy (float32 e int8)
+#
+# Uso (a partir da raiz do projeto):
+#   python benchmarks/busca.py --vetores 50000 --consultas 200
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import Chroma
+from documents.numpy_index import NumpyVectorStore, construir_indice_numpy
+
+class VetoresPrecalculados(Embeddings):
+    """
+    Embeddings que devolvem vetores já gerados, para indexar sem um modelo real.
+    """
+
+    def __init__(self, vetores):
+        self.vetores = vetores
+
+    def embed_documents(self, texts):
+        return [self.vetores[int(texto.split()[-1])].tolist() for texto in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def percentil(valores, p):
+    return round(float(np.percentile(valores, p)) * 1000, 4)
+
+def medir(busca, consultas, k, gabarito):
+    latencias, acertos = [], 0
+    for consulta, esperados in zip(consultas, gabarito):
+        inicio = time.perf_counter()
+        encontrados = busca(consulta, k)
+        latencias.append(time.perf_counter() - inicio)
+        acertos += len(set(encontrados) & esperados)
+    return {
+        "p50_ms": percentil(latencias, 50),
+        "p95_ms": percentil(latencias, 95),
+        "p99_ms": percentil(latencias, 99),
+        f"recall@{k}": round(acertos / (k * len(consultas)), 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da busca vetorial")
+    parser.add_argument("--vetores", type=int, default=10000)
+    parser.add_argument("--dimensao", type=int, default=384)
+    parser.add_argument("--consultas", type=int, default=100)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vetores = rng.standard_normal((args.vetores, args.dimensao), dtype=np.float32)
+    consultas = vetores[rng.integers(0, args.vetores, args.consultas)] \
+        + 0.5 * rng.standard_normal((args.consultas, args.dimensao), dtype=np.float32)
+
+    # Gabarito: top-k exato por similaridade de cosseno
+    normalizados = vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+    gabarito = []
+    for consulta in consultas:
+        scores = normalizados @ (consulta / np.linalg.norm(consulta))
+        gabarito.append(set(np.argsort(-scores)[:args.k].tolist()))
+
+    textos = [f"chunk {i}" for i in range(args.vetores)]
+    metadatas = [{"source": "sintetico", "chunk_id": i} for i in range(args.vetores)]
+    embeddings = VetoresPrecalculados(vetores)
+    resultados = {"parametros": vars(args).copy(), "backends": {}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inicio = time.perf_counter()
+        chroma = Chroma(
+            persist_directory=os.path.join(tmp, "chroma"),
+            embedding_function=embeddings,
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+        for i in range(0, args.vetores, 5000):
+            chroma.add_texts(textos[i:i + 5000], metadatas[i:i + 5000], ids=[str(n) for n in range(i, min(i + 5000, args.vetores))])
+        tempo_chroma = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        diretorio = os.path.join(tmp, "numpy")
+        construir_indice_numpy(vetores, [{"content": t, "metadata": m} for t, m in zip(textos, metadatas)], diretorio)
+        tempo_numpy = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        chroma = Chroma(persist_directory=os.path.join(tmp, "chroma"), embedding_function=embeddings)
+        abertura_chroma = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        indice = NumpyVectorStore(diretorio, embeddings)
+        abertura_numpy = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        indice_int8 = NumpyVectorStore(diretorio, embeddings, quantizado=True)
+        abertura_int8 = time.perf_counter() - inicio
+
+        def busca_chroma(consulta, k):
+            docs = chroma.similarity_search_by_vector(consulta.tolist(), k=k)
+            return [doc.metadata["chunk_id"] for doc in docs]
+
+        def busca_numpy(store):
+            return lambda consulta, k: [linha for linha, _ in store.busca_por_vetor(consulta, k)]
+
+        backends = resultados["backends"]
+        backends["chroma"] = medir(busca_chroma, consultas, args.k, gabarito)
+        backends["chroma"].update(indexacao_s=round(tempo_chroma, 3), abertura_s=round(abertura_chroma, 4))
+        backends["numpy"] = medir(busca_numpy(indice), consultas, args.k, gabarito)
+        backends["numpy"].update(indexacao_s=round(tempo_numpy, 3), abertura_s=round(abertura_numpy, 4))
+        backends["numpy_int8"] = medir(busca_numpy(indice_int8), consultas, args.k, gabarito)
+        backends["numpy_int8"].update(abertura_s=round(abertura_int8, 4))
+
+    saida = json.dumps(resultados, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(saida + "\n")
+    else:
+        print(saida)
+
+if __name__ == "__main__":
+    main()
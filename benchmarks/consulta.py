@@ -0,0 +1,278 @@
+# Benchmark de latência do caminho de uma pergunta no chat (build_retriever_chain + gravação da conversa)
+#
+# Roda offline: um servidor local compatível com a API do Ollama gera tokens com latência
+# configurável e o MongoDB é substituído pelo mongomock (pip install -r requeriments-dev.txt).
+#
+# Uso (a partir da raiz do projeto):
+#   python benchmarks/consulta.py --turnos 50 --latencia-token 5 --saida bench_consulta.json
+#   python benchmarks/consulta.py --referencia bench_consulta.json --tolerancia 0.25
+import argparse
+import inspect
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+import mongomock
+import numpy as np
+from langchain.embeddings.base import Embeddings
+import config
+
+MODELO_FALSO = "llama-falso:bench"
+VOCABULARIO = (
+    "violência contra mulher denúncia delegacia medida protetiva lei maria penha "
+    "agressor vítima atendimento rede proteção acolhimento psicológico assistência "
+    "social saúde segurança pública dados estatísticos taxa homicídio feminicídio "
+    "registro boletim ocorrência espírito santo município estado região período"
+).split()
+
+def criar_servidor_ollama(latencia_token, tokens_resposta, prefill):
+    """
+    Servidor HTTP com /api/tags e /api/generate (streaming NDJSON) no formato do Ollama.
+    """
+
+    class OllamaFalso(BaseHTTPRequestHandler):
+        # HTTP/1.1 com corpo em chunks: cada token chega ao cliente assim que é escrito
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _chunk(self, dados: bytes):
+            self.wfile.write(f"{len(dados):x}\r\n".encode("ascii") + dados + b"\r\n")
+            self.wfile.flush()
+
+        def _json(self, dados):
+            corpo = json.dumps(dados).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def do_GET(self):
+            self._json({"models": [{"name": MODELO_FALSO}]})
+
+        def do_POST(self):
+            pedido = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(prefill)
+            if not pedido.get("stream", True):
+                self._json({"response": "ok", "done": True, "load_duration": 0})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(tokens_resposta):
+                time.sleep(latencia_token)
+                self._chunk((json.dumps({"response": f"token{i} ", "done": False}) + "\n").encode("utf-8"))
+            self._chunk((json.dumps({"response": "", "done": True, "eval_count": tokens_resposta}) + "\n").encode("utf-8"))
+            self._chunk(b"")
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), OllamaFalso)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+class EmbeddingsCronometrados(Embeddings):
+    """
+    Envolve um modelo de embeddings acumulando o tempo gasto nas consultas.
+    """
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+        self.segundos = 0.0
+
+    def embed_documents(self, texts):
+        return self.modelo.embed_documents(texts)
+
+    def embed_query(self, text):
+        inicio = time.perf_counter()
+        vetor = self.modelo.embed_query(text)
+        self.segundos += time.perf_counter() - inicio
+        return vetor
+
+def carregar_modelo(nome):
+    if nome == "fake":
+        from langchain.embeddings import FakeEmbeddings
+        return FakeEmbeddings(size=384)
+    from langchain.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=nome)
+
+def gerar_base(pasta, embedding_model, chunks, seed):
+    """
+    Cria em `pasta` o vectorstore e o corpus (content.jsonl) com chunks sintéticos.
+    """
+    from langchain.vectorstores import Chroma
+    from documents.corpus_store import ChunkCorpus
+
+    rng = random.Random(seed)
+    registros = [
+        {"content": " ".join(rng.choice(VOCABULARIO) for _ in range(120)),
+         "metadata": {"source": f"relatorio_{i // 20:03d}.pdf", "chunk_id": i % 20}}
+        for i in range(chunks)
+    ]
+    corpus = ChunkCorpus(os.path.join(pasta, config.arquivo_corpus))
+    corpus.adicionar(registros)
+    corpus.fechar()
+    Chroma.from_texts(
+        [r["content"] for r in registros], embedding_model,
+        metadatas=[r["metadata"] for r in registros],
+        persist_directory=os.path.join(pasta, "vectorstore")
+    )
+
+def compatibilizar_mongomock():
+    """
+    O pymongo >= 4.11 passa sort= ao montar um UpdateOne no bulk_write, argumento
+    que o mongomock não aceita; sem isso a gravação em segundo plano sempre falha.
+    """
+    from mongomock.collection import BulkOperationBuilder
+    original = BulkOperationBuilder.add_update
+    if "sort" in inspect.signature(original).parameters:
+        return
+
+    def add_update(self, *args, sort=None, **kwargs):
+        return original(self, *args, **kwargs)
+
+    BulkOperationBuilder.add_update = add_update
+
+def percentis(valores):
+    return {f"p{p}_ms": round(float(np.percentile(valores, p)) * 1000, 3) for p in (50, 95, 99)}
+
+def comparar(resultados, referencia, tolerancia):
+    """
+    Lista as etapas cujo p95 piorou mais que a tolerância em relação à referência.
+    """
+    regressoes = []
+    for etapa, atual in resultados["etapas"].items():
+        anterior = referencia.get("etapas", {}).get(etapa)
+        if anterior and atual["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia) + 1:
+            regressoes.append(f"{etapa}: p95 {anterior['p95_ms']}ms -> {atual['p95_ms']}ms")
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latência do caminho de consulta do chat")
+    parser.add_argument("--turnos", type=int, default=30)
+    parser.add_argument("--aquecimento", type=int, default=3, help="turnos iniciais descartados")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latencia-token", type=float, default=5, help="ms por token gerado")
+    parser.add_argument("--tokens-resposta", type=int, default=40)
+    parser.add_argument("--prefill", type=float, default=50, help="ms até o primeiro token")
+    parser.add_argument("--modelo", default="fake", help="'fake' (offline) ou nome de um modelo HuggingFace")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--referencia", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora aceitável do p95 (fração)")
+    args = parser.parse_args()
+
+    servidor = criar_servidor_ollama(args.latencia_token / 1000, args.tokens_resposta, args.prefill / 1000)
+    # Os módulos do chat leem o config na importação: ajustar antes de importá-los
+    config.ollama_url = f"http://127.0.0.1:{servidor.server_address[1]}"
+    config.backend_vetorial = "chroma"
+    os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+    mongomock.patch(servers=(("localhost", 27017),)).start()
+    compatibilizar_mongomock()
+
+    from chat.retriever_chain import build_retriever_chain, responder_pergunta
+    from chat.session_memory import SessionMemory
+    from chat.streaming import StreamlitTokenHandler
+    from db.mongo_client import armazenar_conversas
+    from db.persistencia import PersistenciaConversas
+
+    class CronometroTurno(StreamlitTokenHandler):
+        """
+        Marca o início e o fim da recuperação e o fim da geração da resposta.
+        """
+
+        def __init__(self):
+            super().__init__()
+            self.inicio_busca = self.fim_busca = self.fim_geracao = None
+
+        def on_retriever_start(self, serialized, query, **kwargs):
+            if self.inicio_busca is None:
+                self.inicio_busca = time.perf_counter()
+
+        def on_retriever_end(self, documents, **kwargs):
+            self.fim_busca = time.perf_counter()
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            if run_id in self._runs_llm:
+                self.fim_geracao = time.perf_counter()
+
+    rng = random.Random(args.seed)
+    etapas = {nome: [] for nome in ("embedding", "busca", "montagem_prompt", "prefill", "geracao", "persistencia", "turno")}
+    diretorio_original = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Caminhos relativos do config (vectorstore, content.jsonl) apontam para o diretório temporário
+        os.chdir(tmp)
+        try:
+            embedding_model = EmbeddingsCronometrados(carregar_modelo(args.modelo))
+            gerar_base(tmp, embedding_model.modelo, args.chunks, args.seed)
+            qa_chain = build_retriever_chain(MODELO_FALSO, embedding_model=embedding_model)
+            for cadeia in (qa_chain, qa_chain.combine_docs_chain, qa_chain.combine_docs_chain.llm_chain):
+                cadeia.verbose = False
+            memoria = SessionMemory()
+            # Mesmo caminho do app: com escrita assíncrona o turno só entra na fila de gravação
+            persistencia = PersistenciaConversas() if config.escrita_assincrona else None
+
+            for turno in range(args.aquecimento + args.turnos):
+                pergunta = "Quais dados sobre " + " ".join(rng.sample(VOCABULARIO, 4)) + "?"
+                cronometro = CronometroTurno()
+                embedding_model.segundos = 0.0
+                response = responder_pergunta(qa_chain, pergunta, memoria.mensagens(), callbacks=[cronometro])
+                inicio = time.perf_counter()
+                if persistencia is not None:
+                    persistencia.enfileirar("usuario-bench", pergunta, response["answer"])
+                else:
+                    armazenar_conversas(None, "usuario-bench", pergunta, response["answer"])
+                fim = time.perf_counter()
+                memoria.adicionar(pergunta, response["answer"])
+                if turno < args.aquecimento:
+                    continue
+
+                etapas["embedding"].append(embedding_model.segundos)
+                etapas["busca"].append(cronometro.fim_busca - cronometro.inicio_busca - embedding_model.segundos)
+                etapas["montagem_prompt"].append(cronometro.inicio_geracao - cronometro.fim_busca)
+                etapas["prefill"].append(cronometro.ttft_geracao)
+                # Do primeiro token ao fim: o prefill já é contado na etapa própria
+                etapas["geracao"].append(cronometro.fim_geracao - cronometro.inicio_geracao - cronometro.ttft_geracao)
+                etapas["persistencia"].append(fim - inicio)
+                etapas["turno"].append(fim - cronometro.inicio_turno)
+            if persistencia is not None:
+                persistencia.fechar()
+        finally:
+            os.chdir(diretorio_original)
+            servidor.shutdown()
+
+    resultados = {
+        "parametros": vars(args).copy(),
+        "etapas": {nome: percentis(valores) for nome, valores in etapas.items()},
+    }
+    if persistencia is not None:
+        # A gravação em si acontece fora do turno; o atraso mostra quanto ela fica para trás
+        resultados["escrita_assincrona"] = persistencia.estatisticas()
+
+    codigo = 0
+    if args.referencia:
+        with open(args.referencia, encoding="utf-8") as f:
+            regressoes = comparar(resultados, json.load(f), args.tolerancia)
+        resultados["regressoes"] = regressoes
+        codigo = 1 if regressoes else 0
+
+    saida = json.dumps(resultados, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(saida + "\n")
+    else:
+        print(saida)
+    sys.exit(codigo)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# Benchmark da ingestão de documentos com um corpus sintético de PDFs
+#
+# Uso (a partir da raiz do projeto):
+#   python benchmarks/ingestao.py --pdfs 50 --paginas 20 --saida bench_output.txt
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+import fitz  # PyMuPDF
+from documents.processor import iter_raw_documents, preprocess_batch, chunking
+from documents.embedding_store import embeddar
+
+VOCABULARIO = (
+    "violência contra mulher denúncia delegacia medida protetiva lei maria penha "
+    "agressor vítima atendimento rede proteção acolhimento psicológico assistência "
+    "social saúde segurança pública dados estatísticos taxa homicídio feminicídio "
+    "registro boletim ocorrência espírito santo município estado região período "
+    "ano mês análise relatório observatório política serviço centro referência "
+    "casa abrigo ministério justiça tribunal processo judicial sentença"
+).split()
+CONECTIVOS = "de da do das dos em no na para por com que a o as os e ou não é".split()
+
+def gerar_paragrafo(rng, palavras=60):
+    tokens = []
+    for i in range(palavras):
+        tokens.append(rng.choice(CONECTIVOS if i % 3 == 1 else VOCABULARIO))
+    if rng.random() < 0.3:
+        tokens.append(f"Lei {rng.randint(1000, 15000):,}".replace(",", "."))
+    return " ".join(tokens).capitalize() + "."
+
+def gerar_corpus(pasta, pdfs, paginas, paragrafos_por_pagina, seed):
+    """
+    Gera `pdfs` arquivos PDF sintéticos em português com `paginas` páginas cada.
+    """
+    rng = random.Random(seed)
+    for n in range(pdfs):
+        with fitz.open() as doc:
+            for _ in range(paginas):
+                page = doc.new_page()
+                texto = "\n\n".join(gerar_paragrafo(rng) for _ in range(paragrafos_por_pagina))
+                page.insert_textbox(page.rect + (40, 40, -40, -40), texto, fontsize=9)
+            doc.save(os.path.join(pasta, f"relatorio_{n:05d}.pdf"))
+
+def carregar_modelo(nome):
+    if nome == "fake":
+        from langchain.embeddings import FakeEmbeddings
+        return FakeEmbeddings(size=384)
+    from langchain.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=nome)
+
+def rss_mb() -> float:
+    """
+    Memória residente atual do processo (Linux: /proc/self/statm; fora dele, o pico do ru_maxrss).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class AmostradorRSS(threading.Thread):
+    """
+    Amostra o RSS do processo em segundo plano e guarda o pico. Inclui a memória
+    nativa (MuPDF, modelos de embeddings), que o tracemalloc não enxerga.
+    """
+
+    def __init__(self, intervalo: float = 0.01):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.pico = rss_mb()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, rss_mb())
+
+    def parar(self) -> float:
+        self._parar.set()
+        self.join()
+        return max(self.pico, rss_mb())
+
+def medir(resultados, etapa, itens, unidade, funcao, *args):
+    """
+    Executa uma etapa medindo só o tempo de parede e a vazão.
+    """
+    inicio = time.perf_counter()
+    saida = funcao(*args)
+    duracao = time.perf_counter() - inicio
+    quantidade = itens(saida)
+    resultados[etapa] = {
+        "segundos": round(duracao, 4),
+        unidade: quantidade,
+        f"{unidade}_por_segundo": round(quantidade / duracao, 2) if duracao > 0 else None,
+    }
+    return saida
+
+def medir_memoria(resultados, etapa, itens, unidade, funcao, *args):
+    """
+    Executa uma etapa (numa passada separada da de tempo) medindo o pico de RSS do processo.
+    """
+    inicial = rss_mb()
+    amostrador = AmostradorRSS()
+    amostrador.start()
+    saida = funcao(*args)
+    pico = amostrador.parar()
+    resultados.setdefault(etapa, {}).update({
+        "pico_rss_mb": round(pico, 2),
+        "rss_adicional_mb": round(pico - inicial, 2),
+    })
+    return saida
+
+def extrair(pasta, workers):
+    # O pool é criado e encerrado aqui para que o RSS dos workers entre em RUSAGE_CHILDREN
+    if not workers:
+        return list(iter_raw_documents(pasta))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(iter_raw_documents(pasta, pool, workers))
+
+def executar_etapas(etapas, medidor, pasta, vectorstore, workers, embedding_model):
+    """
+    Roda a ingestão completa medindo cada etapa com `medidor` (medir ou medir_memoria).
+    """
+    raw_docs = medidor(etapas, "extract_text", len, "docs", extrair, pasta, workers)
+    if medidor is medir_memoria and workers:
+        # Maior RSS entre os workers já encerrados (o ru_maxrss dos filhos é um pico acumulado)
+        etapas["extract_text"]["pico_rss_worker_mb"] = round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 2
+        )
+    conteudos = medidor(etapas, "preprocess_text", len, "docs",
+                        preprocess_batch, [doc["content"] for doc in raw_docs])
+    docs = [{"source": doc["source"], "content": conteudo} for doc, conteudo in zip(raw_docs, conteudos)]
+    del raw_docs, conteudos
+
+    chunks = medidor(etapas, "chunking", len, "chunks", chunking, docs)
+    medidor(etapas, "embeddar", lambda _: len(chunks), "chunks",
+            embeddar, chunks, vectorstore, embedding_model)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da ingestão de PDFs")
+    parser.add_argument("--pdfs", type=int, default=2)
+    parser.add_argument("--paginas", type=int, default=10)
+    parser.add_argument("--paragrafos", type=int, default=6, help="parágrafos por página")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="0 para extração sequencial")
+    parser.add_argument("--modelo", default="fake", help="'fake' (offline) ou nome de um modelo HuggingFace")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sem-memoria", action="store_true", help="pula a passada que mede a memória")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    resultados = {"parametros": vars(args).copy(), "etapas": {}}
+    etapas = resultados["etapas"]
+    with tempfile.TemporaryDirectory() as tmp:
+        pasta = os.path.join(tmp, "files")
+        os.makedirs(pasta)
+        inicio = time.perf_counter()
+        gerar_corpus(pasta, args.pdfs, args.paginas, args.paragrafos, args.seed)
+        resultados["geracao_corpus_segundos"] = round(time.perf_counter() - inicio, 4)
+
+        embedding_model = carregar_modelo(args.modelo)
+        # Tempo e memória em passadas separadas: a medição de memória não pesa no tempo
+        executar_etapas(etapas, medir, pasta, os.path.join(tmp, "vectorstore"), args.workers, embedding_model)
+        if not args.sem_memoria:
+            executar_etapas(etapas, medir_memoria, pasta, os.path.join(tmp, "vectorstore_memoria"),
+                            args.workers, embedding_model)
+
+    resultados["total_segundos"] = round(sum(e["segundos"] for e in etapas.values()), 4)
+    resultados["pico_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+    saida = json.dumps(resultados, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(saida + "\n")
+    else:
+        print(saida)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Tempo de importação a frio dos módulos do app (o que cada worker e cada hot reload do Streamlit paga)
+#
+# Cada medição roda num interpretador novo. "main.py" importa os mesmos módulos que o topo do main.py.
+#
+# Uso (a partir da raiz do projeto):
+#   python benchmarks/inicializacao.py --repeticoes 5 --saida bench_inicializacao.json
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULOS = [
+    "chat.retriever_chain",
+    "db.mongo_client",
+    "db.login",
+    "documents.normalizer",
+    "visualization.graph",
+]
+
+def imports_do_main():
+    """
+    Instruções de import de nível de módulo do main.py.
+    """
+    with open(os.path.join(project_root, "main.py"), encoding="utf-8") as f:
+        arvore = ast.parse(f.read())
+    return "\n".join(ast.unparse(no) for no in arvore.body if isinstance(no, (ast.Import, ast.ImportFrom)))
+
+def medir(codigo, repeticoes):
+    """
+    Mediana do tempo de parede para executar `codigo` num interpretador novo.
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        processo = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=project_root, capture_output=True, text=True,
+            env=dict(os.environ, PYTHONPATH=project_root + os.pathsep + os.path.join(project_root, "documents"))
+        )
+        tempos.append(time.perf_counter() - inicio)
+        if processo.returncode != 0:
+            return {"erro": processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else "falhou"}
+    return {"mediana_s": round(statistics.median(tempos), 4), "min_s": round(min(tempos), 4)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação a frio dos módulos do app")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    base = medir("pass", args.repeticoes)
+    resultados = {"parametros": vars(args).copy(), "interpretador_vazio": base, "modulos": {}}
+    for modulo in MODULOS:
+        resultados["modulos"][modulo] = medir(f"import {modulo}", args.repeticoes)
+    resultados["modulos"]["main.py"] = medir(imports_do_main(), args.repeticoes)
+
+    saida = json.dumps(resultados, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(saida + "\n")
+    else:
+        print(saida)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema.document import Document
+from config import limiar_cache_respostas, ttl_cache_respostas, tamanho_cache_respostas
+
+def fingerprint_fontes(docs: List[Document]) -> str:
+    """
+    Gera uma impressão digital dos chunks recuperados (source + chunk_id),
+    independente da ordem em que vieram.
+    """
+    chaves = sorted(
+        f"{doc.metadata.get('source')}:{doc.metadata.get('chunk_id')}" for doc in docs
+    )
+    return hashlib.sha1("|".join(chaves).encode("utf-8")).hexdigest()
+
+def versao_vectorstore(persist_directory: str = "vectorstore") -> Optional[float]:
+    """
+    Identifica a versão atual do vectorstore pela data de modificação
+    do manifesto de ingestão (ou do banco do Chroma, se não houver manifesto).
+    """
+    for nome in ("manifest.json", "chroma.sqlite3"):
+        caminho = os.path.join(persist_directory, nome)
+        if os.path.exists(caminho):
+            return os.path.getmtime(caminho)
+    return None
+
+class SemanticAnswerCache:
+    """
+    Cache semântico de respostas. Uma pergunta reaproveita a resposta de uma
+    pergunta anterior quando a similaridade de cosseno entre elas passa do
+    limiar e os chunks recuperados para as duas são os mesmos. As perguntas
+    devem chegar já reescritas sem depender do histórico da conversa.
+    Tem expiração por TTL, remoção LRU e é esvaziado quando o vectorstore muda.
+    """
+
+    def __init__(self, embedding_model: Embeddings, limiar: float = limiar_cache_respostas,
+                 ttl: float = ttl_cache_respostas, tamanho: int = tamanho_cache_respostas,
+                 persist_directory: str = "vectorstore"):
+        self.embedding_model = embedding_model
+        self.limiar = limiar
+        self.ttl = ttl
+        self.tamanho = tamanho
+        self.persist_directory = persist_directory
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._versao = versao_vectorstore(persist_directory)
+        self._proximo_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.latencia_economizada = 0.0
+
+    def _vetor(self, pergunta: str) -> np.ndarray:
+        vetor = np.asarray(self.embedding_model.embed_query(pergunta), dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+    def _verificar_versao(self):
+        versao = versao_vectorstore(self.persist_directory)
+        if versao != self._versao:
+            logging.info("Vectorstore alterado: cache de respostas invalidado.")
+            self._entradas.clear()
+            self._versao = versao
+
+    def _remover_expiradas(self, agora: float):
+        expiradas = [
+            chave for chave, entrada in self._entradas.items()
+            if agora - entrada["criado_em"] > self.ttl
+        ]
+        for chave in expiradas:
+            del self._entradas[chave]
+
+    def buscar(self, pergunta: str, fingerprint: str) -> Optional[str]:
+        """
+        Retorna a resposta em cache para a pergunta, ou None.
+        """
+        vetor = self._vetor(pergunta)
+        with self._lock:
+            self._verificar_versao()
+            self._remover_expiradas(time.time())
+            melhor, melhor_sim = None, self.limiar
+            for chave, entrada in self._entradas.items():
+                if entrada["fingerprint"] != fingerprint:
+                    continue
+                similaridade = float(np.dot(vetor, entrada["vetor"]))
+                if similaridade >= melhor_sim:
+                    melhor, melhor_sim = chave, similaridade
+
+            if melhor is None:
+                self.misses += 1
+                return None
+
+            entrada = self._entradas[melhor]
+            self._entradas.move_to_end(melhor)
+            self.hits += 1
+            self.latencia_economizada += entrada["latencia"]
+            logging.info(f"Cache de respostas: acerto (similaridade {melhor_sim:.3f}) para '{pergunta}'.")
+            return entrada["resposta"]
+
+    def armazenar(self, pergunta: str, resposta: str, fingerprint: str, latencia: float):
+        """
+        Guarda a resposta gerada e o tempo que a geração levou.
+        """
+        vetor = self._vetor(pergunta)
+        with self._lock:
+            self._verificar_versao()
+            self._entradas[self._proximo_id] = {
+                "vetor": vetor,
+                "pergunta": pergunta,
+                "resposta": resposta,
+                "fingerprint": fingerprint,
+                "latencia": latencia,
+                "criado_em": time.time(),
+            }
+            self._proximo_id += 1
+            while len(self._entradas) > self.tamanho:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else 0.0,
+                "latencia_economizada_s": round(self.latencia_economizada, 3),
+            }
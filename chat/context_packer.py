@@ -0,0 +1,111 @@
+import logging
+from typing import Any, List
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever
+from langchain.schema.document import Document
+from config import orcamento_tokens_contexto
+from metricas import span
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimativa barata do número de tokens (~4 caracteres por token).
+    """
+    return len(texto) // 4 + 1
+
+def _juntar_textos(anterior: str, proximo: str, max_overlap: int = 200) -> str:
+    """
+    Concatena dois chunks consecutivos removendo o trecho repetido pelo overlap do chunking.
+    """
+    for tamanho in range(min(max_overlap, len(anterior), len(proximo)), 0, -1):
+        if anterior.endswith(proximo[:tamanho]):
+            return anterior + proximo[tamanho:]
+    return anterior + " " + proximo
+
+def _shingles(texto: str, n: int = 3) -> set:
+    palavras = texto.split()
+    return {tuple(palavras[i:i + n]) for i in range(max(len(palavras) - n + 1, 1))}
+
+def _sobreposicao(a: set, b: set) -> float:
+    """
+    Fração do menor conjunto de shingles contida no outro (pega trechos repetidos
+    mesmo quando um está contido num trecho maior).
+    """
+    return len(a & b) / min(len(a), len(b)) if a and b else 0.0
+
+def mesclar_adjacentes(docs: List[Document]) -> List[Document]:
+    """
+    Junta chunks consecutivos (chunk_id seguidos) do mesmo source em um só documento,
+    que herda a melhor posição de relevância entre as partes.
+    """
+    posicao = {id(doc): i for i, doc in enumerate(docs)}
+    por_source = {}
+    for doc in docs:
+        por_source.setdefault(doc.metadata.get("source"), []).append(doc)
+
+    mesclados = []
+    for source, grupo in por_source.items():
+        grupo = sorted(grupo, key=lambda d: d.metadata.get("chunk_id", 0))
+        atual, rank, ids = grupo[0].page_content, posicao[id(grupo[0])], [grupo[0].metadata.get("chunk_id")]
+        for doc in grupo[1:]:
+            chunk_id = doc.metadata.get("chunk_id")
+            if chunk_id is not None and ids[-1] is not None and chunk_id == ids[-1] + 1:
+                atual = _juntar_textos(atual, doc.page_content)
+                rank = min(rank, posicao[id(doc)])
+                ids.append(chunk_id)
+                continue
+            mesclados.append((rank, Document(page_content=atual, metadata={"source": source, "chunk_id": ids[0], "chunk_ids": ids})))
+            atual, rank, ids = doc.page_content, posicao[id(doc)], [chunk_id]
+        mesclados.append((rank, Document(page_content=atual, metadata={"source": source, "chunk_id": ids[0], "chunk_ids": ids})))
+
+    return [doc for _, doc in sorted(mesclados, key=lambda item: item[0])]
+
+def empacotar_contexto(docs: List[Document], orcamento_tokens: int = orcamento_tokens_contexto,
+                       limiar_duplicata: float = 0.8) -> List[Document]:
+    """
+    Mescla chunks adjacentes, descarta quase-duplicatas e preenche o orçamento
+    de tokens do contexto seguindo a ordem de relevância.
+    """
+    selecionados, shingles_selecionados = [], []
+    usados = 0
+    for doc in mesclar_adjacentes(docs):
+        shingles = _shingles(doc.page_content)
+        if any(_sobreposicao(shingles, outro) >= limiar_duplicata for outro in shingles_selecionados):
+            continue
+        tokens = estimar_tokens(doc.page_content)
+        if usados + tokens > orcamento_tokens:
+            if selecionados:
+                continue
+            # O documento mais relevante sempre entra, truncado ao orçamento
+            doc = Document(page_content=doc.page_content[:orcamento_tokens * 4], metadata=doc.metadata)
+            tokens = orcamento_tokens
+        selecionados.append(doc)
+        shingles_selecionados.append(shingles)
+        usados += tokens
+
+    logging.info(f"Contexto empacotado: {len(docs)} chunks -> {len(selecionados)} trechos, ~{usados} tokens.")
+    return selecionados
+
+class ContextPackingRetriever(BaseRetriever):
+    """
+    Envolve outro retriever e empacota o resultado dentro de um orçamento de tokens
+    antes de ele ir para o prompt.
+    """
+
+    base_retriever: Any
+    orcamento_tokens: int = orcamento_tokens_contexto
+    limiar_duplicata: float = 0.8
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # A recuperação inclui o embedding da consulta (também medido no span "embedding")
+        with span("recuperacao") as atributos:
+            docs = self.base_retriever.get_relevant_documents(query, callbacks=run_manager.get_child())
+            atributos["documentos"] = len(docs)
+        with span("empacotamento") as atributos:
+            docs = empacotar_contexto(docs, self.orcamento_tokens, self.limiar_duplicata)
+            atributos["trechos"] = len(docs)
+        return docs
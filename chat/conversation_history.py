@@ -1,17 +1,15 @@
 import os
 import sys
 import logging
-from pymongo import MongoClient
 from datetime import datetime
 from typing import List, Dict
-from dotenv import load_dotenv
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
 from db.mongo_client import conectar
 
-# Conexão com o MongoDB
+# Banco de dados via cliente compartilhado do processo
 db = conectar()
 
 colecao_usuarios = db.usuarios
@@ -41,7 +39,7 @@ def recuperar_historico(usuario: str, limite: int = 10) -> List[Dict]:
     """
     try:
         historico = list(
-            colecao_conversas.find({"cod": usuario}).sort("timestamp", -1).limit(limite)
+            colecao_conversas.find({"cod": usuario}).sort("_id", -1).limit(limite)
         )
         logging.info(f"{len(historico)} interações recuperadas para usuário: {usuario}")
         return historico
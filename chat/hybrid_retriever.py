@@ -0,0 +1,138 @@
+import logging
+import math
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever
+from langchain.schema.document import Document
+from documents.corpus_store import ChunkCorpus
+from documents.normalizer import preprocess_text
+
+class BM25Index:
+    """
+    Índice invertido em memória com ranqueamento BM25.
+
+    Cada termo aponta para dois arrays compactos (ids dos chunks e frequências).
+    O texto indexado já vem pré-processado pela ingestão, então basta separar
+    os tokens por espaço; a consulta passa pelo mesmo normalizador.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chaves: List[Tuple[str, int]] = []
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._idf: Dict[str, float] = {}
+        self._norma = array("f")
+
+    @classmethod
+    def construir(cls, chunks, **kwargs) -> "BM25Index":
+        """
+        Constrói o índice percorrendo os chunks ({'content', 'metadata'}) uma única vez.
+        """
+        indice = cls(**kwargs)
+        postings = defaultdict(lambda: (array("I"), array("I")))
+        tamanhos = array("I")
+        for doc_id, chunk in enumerate(chunks):
+            metadata = chunk["metadata"]
+            indice.chaves.append((metadata["source"], metadata["chunk_id"]))
+            tokens = chunk["content"].split()
+            tamanhos.append(len(tokens))
+            frequencias = defaultdict(int)
+            for token in tokens:
+                frequencias[token] += 1
+            for token, tf in frequencias.items():
+                ids, tfs = postings[token]
+                ids.append(doc_id)
+                tfs.append(tf)
+
+        total = len(tamanhos)
+        media = (sum(tamanhos) / total) if total else 0.0
+        indice._postings = dict(postings)
+        indice._idf = {
+            termo: math.log(1 + (total - len(ids) + 0.5) / (len(ids) + 0.5))
+            for termo, (ids, _) in indice._postings.items()
+        }
+        indice._norma = array("f", (
+            indice.k1 * (1 - indice.b + indice.b * tamanho / media) if media else indice.k1
+            for tamanho in tamanhos
+        ))
+        logging.info(f"Índice BM25 construído: {total} chunks, {len(indice._postings)} termos.")
+        return indice
+
+    def __len__(self):
+        return len(self.chaves)
+
+    def buscar(self, consulta: str, k: int = 20) -> List[Tuple[Tuple[str, int], float]]:
+        """
+        Retorna até k pares ((source, chunk_id), score) ordenados por relevância.
+        """
+        scores = defaultdict(float)
+        for termo in set(preprocess_text(consulta).split()):
+            posting = self._postings.get(termo)
+            if posting is None:
+                continue
+            idf = self._idf[termo]
+            for doc_id, tf in zip(*posting):
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self._norma[doc_id])
+        melhores = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.chaves[doc_id], score) for doc_id, score in melhores]
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever que combina a busca densa do vectorstore com BM25 sobre o corpus
+    de chunks, fundindo os dois rankings por reciprocal-rank fusion (RRF).
+    Se a consulta não puder ser normalizada para o BM25 (ex.: tokenizador do
+    NLTK ausente e sem rede), usa só a busca densa.
+    """
+
+    vectorstore: Any
+    indice: BM25Index
+    corpus: ChunkCorpus
+    k: int = 4
+    k_candidatos: int = 20
+    rrf_k: int = 60
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        pontuacao = defaultdict(float)
+        documentos = {}
+
+        densos = self.vectorstore.similarity_search(query, k=self.k_candidatos)
+        for posicao, doc in enumerate(densos):
+            chave = (doc.metadata.get("source"), doc.metadata.get("chunk_id"))
+            pontuacao[chave] += 1 / (self.rrf_k + posicao + 1)
+            documentos.setdefault(chave, doc)
+
+        try:
+            lexicos = self.indice.buscar(query, self.k_candidatos)
+        except LookupError:
+            logging.warning("Tokenizador do NLTK indisponível: busca BM25 ignorada, usando apenas a busca densa.")
+            lexicos = []
+        for posicao, (chave, _) in enumerate(lexicos):
+            pontuacao[chave] += 1 / (self.rrf_k + posicao + 1)
+
+        melhores = sorted(pontuacao, key=pontuacao.get, reverse=True)[:self.k]
+        resultado = []
+        for chave in melhores:
+            doc = documentos.get(chave)
+            if doc is None:
+                chunk = self.corpus.get(*chave)
+                if chunk is None:
+                    continue
+                doc = Document(page_content=chunk["content"], metadata=chunk["metadata"])
+            resultado.append(doc)
+        return resultado
+
+def criar_hybrid_retriever(vectordb, corpus_path: str, k: int = 4) -> HybridRetriever:
+    """
+    Abre o corpus de chunks, constrói o índice BM25 e devolve o retriever híbrido.
+    """
+    corpus = ChunkCorpus(corpus_path)
+    indice = BM25Index.construir(iter(corpus))
+    return HybridRetriever(vectorstore=vectordb, indice=indice, corpus=corpus, k=k)
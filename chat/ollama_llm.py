@@ -1,34 +1,80 @@
+import json
 import logging
-import subprocess
+import threading
+import time
+import urllib.request
 from langchain_community.llms.ollama import Ollama
-from config import modelo_llm
+from config import modelo_llm, ollama_url, ollama_keep_alive, ttl_modelos_ollama, tempo_max_resposta
 
-def list_ollama_models():
+_cache_modelos = {"modelos": None, "expira_em": 0.0}
+_cache_lock = threading.Lock()
+
+# Resultado do aquecimento do modelo (preenchido pela thread de aquecimento)
+aquecimento = {"modelo": None, "concluido": False, "segundos": None, "carga_s": None}
+
+def _requisitar(caminho: str, corpo: dict = None, timeout: float = 5.0) -> dict:
+    """
+    Faz uma requisição à API HTTP do Ollama (GET, ou POST quando há corpo) e devolve o JSON.
+    """
+    dados = json.dumps(corpo).encode("utf-8") if corpo is not None else None
+    req = urllib.request.Request(
+        f"{ollama_url.rstrip('/')}{caminho}", data=dados, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resposta:
+        return json.loads(resposta.read().decode("utf-8"))
+
+def list_ollama_models(usar_cache: bool = True):
     """
-    Lista os modelos disponíveis localmente no Ollama.
-    Executa o comando 'ollama list' e extrai os nomes dos modelos.
+    Lista os modelos disponíveis localmente no Ollama pela API HTTP (/api/tags).
+    O resultado fica em cache por ttl_modelos_ollama segundos.
     """
+    with _cache_lock:
+        if usar_cache and _cache_modelos["modelos"] is not None and time.monotonic() < _cache_modelos["expira_em"]:
+            return _cache_modelos["modelos"]
+
     try:
-        result = subprocess.run(["ollama", "list"], capture_output=True, text=True, check=True)
-        lines = result.stdout.strip().splitlines()
-
-        # Ignora o cabeçalho e pega o nome da primeira coluna
-        models = []
-        for line in lines[1:]:
-            parts = line.strip().split()
-            if parts:
-                models.append(parts[0])
+        models = [m["name"] for m in _requisitar("/api/tags").get("models", [])]
         logging.info(f"Modelos disponíveis no Ollama: {models}")
-        return models
-
-    except subprocess.CalledProcessError as e:
-        logging.error("Erro ao executar 'ollama list'. Verifique se o Ollama está instalado e em execução.")
-        return []
     except Exception as e:
-        logging.error(f"Erro inesperado ao listar modelos do Ollama: {e}")
+        logging.error(f"Erro ao listar modelos do Ollama em {ollama_url}. Verifique se o Ollama está em execução: {e}")
         return []
 
-def get_ollama_llm(modelo_llm: str, temperature: float = 0.1) -> Ollama:
+    with _cache_lock:
+        _cache_modelos["modelos"] = models
+        _cache_modelos["expira_em"] = time.monotonic() + ttl_modelos_ollama
+    return models
+
+def _aquecer(modelo: str, keep_alive: str):
+    inicio = time.perf_counter()
+    try:
+        # Geração de um único token: carrega o modelo na memória do Ollama e o mantém residente
+        resposta = _requisitar("/api/generate", {
+            "model": modelo, "prompt": "Olá", "stream": False,
+            "keep_alive": keep_alive, "options": {"num_predict": 1}
+        }, timeout=600)
+        aquecimento.update(
+            concluido=True,
+            segundos=time.perf_counter() - inicio,
+            carga_s=resposta.get("load_duration", 0) / 1e9
+        )
+        logging.info(
+            f"Modelo '{modelo}' aquecido: primeira resposta em {aquecimento['segundos']:.2f}s "
+            f"(carga do modelo: {aquecimento['carga_s']:.2f}s)."
+        )
+    except Exception as e:
+        logging.warning(f"Falha ao aquecer o modelo '{modelo}': {e}")
+
+def aquecer_modelo(modelo: str, keep_alive: str = ollama_keep_alive) -> threading.Thread:
+    """
+    Dispara em segundo plano uma geração mínima para que o Ollama carregue o modelo
+    antes da primeira pergunta. O tempo de cold start fica em `aquecimento`.
+    """
+    aquecimento.update(modelo=modelo, concluido=False, segundos=None, carga_s=None)
+    thread = threading.Thread(target=_aquecer, args=(modelo, keep_alive), name="aquecimento-ollama", daemon=True)
+    thread.start()
+    return thread
+
+def get_ollama_llm(modelo_llm: str, temperature: float = 0.1, aquecer: bool = True) -> Ollama:
     """
     Retorna uma instância da LLM conectada ao modelo local do Ollama.
     """
@@ -38,8 +84,12 @@ def get_ollama_llm(modelo_llm: str, temperature: float = 0.1) -> Ollama:
         raise ValueError(f"Modelo '{modelo_llm}' não está disponível localmente no Ollama.")
 
     try:
-        llm = Ollama(model=modelo_llm, temperature=temperature)
+        # O timeout HTTP evita que uma geração travada prenda o worker da fila indefinidamente
+        llm = Ollama(model=modelo_llm, temperature=temperature, base_url=ollama_url,
+                     keep_alive=ollama_keep_alive, timeout=tempo_max_resposta)
         logging.info(f"Modelo '{modelo_llm}' carregado com sucesso via Ollama.")
+        if aquecer:
+            aquecer_modelo(modelo_llm)
         return llm
     except Exception as e:
         logging.error(f"Erro ao inicializar o modelo '{modelo_llm}': {e}")
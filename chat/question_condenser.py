@@ -0,0 +1,95 @@
+import logging
+import re
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+from langchain.callbacks.manager import CallbackManagerForChainRun
+from langchain.chains import LLMChain
+from langchain.pydantic_v1 import Field
+from config import modo_condensacao
+from metricas import span
+
+# Palavras que indicam que a pergunta depende do histórico para fazer sentido
+# ("esta"/"estas" ficam de fora: sem acento se confundem com o verbo "está")
+_REFERENCIAS = re.compile(
+    r"\b(isso|isto|disso|disto|nisso|nisto|esse|essa|esses|essas|este|estes|"
+    r"desse|dessa|deste|desta|nesse|nessa|neste|nesta|aquele|aquela|aquilo|daquele|daquela|"
+    r"ele|ela|eles|elas|dele|dela|deles|delas|nele|nela|mesmo|mesma|anterior|acima|la|ali)\b"
+)
+_CONECTIVOS_INICIAIS = re.compile(r"^(e|mas|entao|tambem|e se|e sobre|e quanto|e no|e na|e para|por que nao)\b")
+
+def _sem_acentos(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn")
+
+def pergunta_autocontida(pergunta: str) -> bool:
+    """
+    Heurística: a pergunta se sustenta sozinha se não for muito curta, não
+    começar com um conectivo ("e sobre...", "mas...") e não usar pronomes ou
+    demonstrativos que apontam para a conversa anterior.
+    """
+    texto = _sem_acentos(pergunta.lower()).strip()
+    if len(texto.split()) <= 3:
+        return False
+    return not (_CONECTIVOS_INICIAIS.search(texto) or _REFERENCIAS.search(texto))
+
+def reescrita_local(pergunta: str, chat_history: str) -> str:
+    """
+    Reescrita barata: prefixa a pergunta com a última pergunta do usuário no histórico.
+    """
+    anteriores = [
+        linha[len("Human: "):] for linha in chat_history.splitlines() if linha.startswith("Human: ")
+    ]
+    if not anteriores:
+        return pergunta
+    return f"{anteriores[-1]} {pergunta}"
+
+class QuestionCondenser(LLMChain):
+    """
+    Substitui a cadeia que reescreve a pergunta a partir do histórico no
+    ConversationalRetrievalChain.
+
+    Modos:
+    - "llm": sempre gera a pergunta reescrita com a LLM (comportamento original);
+    - "auto": perguntas autocontidas seguem direto, as demais vão para a LLM;
+    - "local": perguntas autocontidas seguem direto, as demais recebem a
+      reescrita local, sem nenhuma geração.
+    """
+
+    modo: str = modo_condensacao
+    contadores: Dict[str, float] = Field(default_factory=lambda: {
+        "autocontidas": 0, "reescritas_locais": 0, "chamadas_llm": 0, "segundos_llm": 0.0
+    })
+
+    def usa_llm(self, pergunta: str) -> bool:
+        """
+        Indica se a reescrita desta pergunta chama a LLM (e deve passar pela fila de inferência).
+        """
+        return self.modo == "llm" or (self.modo == "auto" and not pergunta_autocontida(pergunta))
+
+    def _call(self, inputs: Dict[str, Any],
+              run_manager: Optional[CallbackManagerForChainRun] = None) -> Dict[str, str]:
+        pergunta = inputs["question"]
+        with span("condensacao", modo=self.modo) as atributos:
+            if self.modo != "llm" and pergunta_autocontida(pergunta):
+                self.contadores["autocontidas"] += 1
+                atributos["caminho"] = "autocontida"
+                return {self.output_key: pergunta}
+
+            if self.modo == "local":
+                self.contadores["reescritas_locais"] += 1
+                atributos["caminho"] = "local"
+                return {self.output_key: reescrita_local(pergunta, inputs.get("chat_history", ""))}
+
+            atributos["caminho"] = "llm"
+            inicio = time.perf_counter()
+            resultado = super()._call(inputs, run_manager)
+            duracao = time.perf_counter() - inicio
+        self.contadores["chamadas_llm"] += 1
+        self.contadores["segundos_llm"] += duracao
+        logging.info(f"Pergunta reescrita pela LLM em {duracao:.2f}s.")
+        return resultado
+
+    def estatisticas(self) -> Dict[str, float]:
+        # Perguntas que seguiram sem a geração de reescrita que o modo "llm" faria
+        economizadas = self.contadores["autocontidas"] + self.contadores["reescritas_locais"]
+        return dict(self.contadores, geracoes_economizadas=economizadas, modo=self.modo)
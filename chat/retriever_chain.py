@@ -1,19 +1,46 @@
 import logging
+import os
+import time
+from typing import Callable
 from langchain.vectorstores import Chroma
 from langchain.chains import ConversationalRetrievalChain
-from langchain.embeddings import HuggingFaceEmbeddings
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain.embeddings.base import Embeddings
 from langchain.llms.base import BaseLLM
 from langchain.memory import ConversationBufferMemory
 from langchain.prompts import PromptTemplate
+from chat.answer_cache import SemanticAnswerCache, fingerprint_fontes
+from chat.context_packer import ContextPackingRetriever
+from chat.hybrid_retriever import criar_hybrid_retriever
+from chat.question_condenser import QuestionCondenser
+from chat.streaming import TAG_RESPOSTA
 from chat.ollama_llm import get_ollama_llm
-from config import modelo, modelo_llm
+from config import (
+    modelo_llm, modo_busca, arquivo_corpus, backend_vetorial, diretorio_indice_numpy,
+    k_candidatos_contexto, orcamento_tokens_contexto
+)
+from metricas import span
+from documents.embedding_cache import get_query_embedding_model
+from documents.numpy_index import NumpyVectorStore
 
-def load_vectorstore(persist_directory: str = "vectorstore") -> Chroma:
+def load_vectorstore(persist_directory: str = "vectorstore", embedding_model: Embeddings = None) -> Chroma:
     """
     Carrega o banco vetorial persistido usando ChromaDB com embeddings do HuggingFace.
+    O modelo de embeddings é compartilhado com o cache em disco da ingestão e
+    as consultas passam por um cache LRU de embeddings.
+    Com config.backend_vetorial "numpy"/"numpy_int8" carrega o índice NumPy exportado.
+    Um embedding_model pode ser passado para substituir o padrão (ex.: benchmarks).
     """
     try:
-        embedding_model = HuggingFaceEmbeddings(model_name=modelo)
+        embedding_model = embedding_model or get_query_embedding_model()
+        if backend_vetorial in ("numpy", "numpy_int8"):
+            vectordb = NumpyVectorStore(
+                diretorio_indice_numpy,
+                embedding_model,
+                quantizado=backend_vetorial == "numpy_int8"
+            )
+            logging.info("Índice vetorial NumPy carregado com sucesso.")
+            return vectordb
         vectordb = Chroma(
             persist_directory=persist_directory,
             embedding_function=embedding_model
@@ -24,15 +51,33 @@ def load_vectorstore(persist_directory: str = "vectorstore") -> Chroma:
         logging.error(f"Erro ao carregar vectorstore: {e}")
         raise
 
-def build_retriever_chain(modelo_llm: str, memory: ConversationBufferMemory,persist_directory: str = "vectorstore") -> ConversationalRetrievalChain:
+def criar_retriever(vectordb: Chroma, k: int = 4):
     """
-    Cria a cadeia de QA usando o modelo Ollama LLM + Chroma como retriever, com memória de conversa.
+    Cria o retriever configurado em config.modo_busca. O modo híbrido precisa
+    do corpus de chunks gerado pela ingestão; sem ele, usa só a busca densa.
+    """
+    if modo_busca == "hibrido":
+        if os.path.exists(arquivo_corpus):
+            return criar_hybrid_retriever(vectordb, arquivo_corpus, k=k)
+        logging.warning(f"Corpus '{arquivo_corpus}' não encontrado, usando apenas a busca densa.")
+    return vectordb.as_retriever(search_kwargs={"k": k})
+
+def build_retriever_chain(modelo_llm: str, memory: ConversationBufferMemory = None, persist_directory: str = "vectorstore",
+                          embedding_model: Embeddings = None) -> ConversationalRetrievalChain:
+    """
+    Cria a cadeia de QA usando o modelo Ollama LLM + Chroma como retriever.
+    Sem memória a cadeia não guarda estado e pode ser compartilhada entre
+    sessões; o histórico de cada sessão é passado em 'chat_history' a cada chamada.
     """
     try:
         print(f"Carregando modelo LLM: {modelo_llm}")
         llm: BaseLLM = get_ollama_llm(modelo_llm)
-        vectordb: Chroma = load_vectorstore(persist_directory)
-        retriever = vectordb.as_retriever(search_kwargs={"k": 4})
+        vectordb: Chroma = load_vectorstore(persist_directory, embedding_model)
+        # Busca mais candidatos e deixa o empacotador escolher o que cabe no orçamento
+        retriever = ContextPackingRetriever(
+            base_retriever=criar_retriever(vectordb, k=k_candidatos_contexto),
+            orcamento_tokens=orcamento_tokens_contexto
+        )
 
         # Prompt estruturado
         prompt_template = PromptTemplate(
@@ -73,6 +118,15 @@ Pergunta Atual:
             return_source_documents=True,
             verbose=True
         )
+        # Marca a cadeia da resposta final para o streaming de tokens na interface
+        qa_chain.combine_docs_chain.tags = [TAG_RESPOSTA]
+        # Evita a geração extra da LLM para reescrever perguntas que não dependem do histórico
+        qa_chain.question_generator = QuestionCondenser(
+            llm=llm,
+            prompt=qa_chain.question_generator.prompt
+        )
+        # A reescrita local só serve de consulta para a busca; o prompt recebe a pergunta original
+        qa_chain.rephrase_question = qa_chain.question_generator.modo != "local"
 
         logging.info("Cadeia de QA com retriever, memória e prompt customizado criada com sucesso.")
         return qa_chain
@@ -80,3 +134,85 @@ Pergunta Atual:
     except Exception as e:
         logging.error(f"Erro ao criar a cadeia de QA: {e}")
         raise
+
+def preparar_resposta(qa_chain: ConversationalRetrievalChain, pergunta: str, chat_history: list,
+                      answer_cache: SemanticAnswerCache = None, callbacks: list = None,
+                      executar: Callable = None) -> dict:
+    """
+    Etapas da cadeia antes da geração da resposta: reescreve a pergunta sem
+    depender do histórico, recupera os documentos e consulta o cache semântico.
+    Com acerto no cache, o dict já traz "answer". Só a reescrita pela LLM
+    (modos "llm"/"auto") passa por `executar(funcao, *args, **kwargs)`, para
+    que gerações fiquem na fila de inferência e a busca não.
+    """
+    executar = executar or (lambda funcao, *args, **kwargs: funcao(*args, **kwargs))
+    historico = (qa_chain.get_chat_history or _get_chat_history)(chat_history) if chat_history else ""
+    pergunta_independente = pergunta
+    if historico:
+        condensador = qa_chain.question_generator
+        argumentos = dict(question=pergunta, chat_history=historico, callbacks=callbacks)
+        if condensador.usa_llm(pergunta):
+            pergunta_independente = executar(condensador.run, **argumentos)
+        else:
+            pergunta_independente = condensador.run(**argumentos)
+
+    docs = qa_chain.retriever.get_relevant_documents(pergunta_independente, callbacks=callbacks)
+    preparo = {
+        "question": pergunta,
+        "pergunta_independente": pergunta_independente,
+        "historico": historico,
+        "source_documents": docs,
+        "fingerprint": fingerprint_fontes(docs),
+    }
+    if answer_cache is None:
+        return preparo
+
+    with span("cache_respostas") as atributos:
+        resposta = answer_cache.buscar(pergunta_independente, preparo["fingerprint"])
+        atributos["cache_hit"] = resposta is not None
+    if resposta is not None:
+        if qa_chain.memory is not None:
+            qa_chain.memory.save_context({"question": pergunta}, {"answer": resposta})
+        preparo.update(answer=resposta, cache=True)
+    return preparo
+
+def gerar_resposta(qa_chain: ConversationalRetrievalChain, preparo: dict,
+                   answer_cache: SemanticAnswerCache = None, callbacks: list = None) -> dict:
+    """
+    Gera a resposta com a LLM a partir de preparar_resposta. O cache é
+    compartilhado entre usuários: só entram nele respostas geradas sem
+    histórico, que não podem citar a conversa de ninguém.
+    """
+    pergunta = preparo["question"]
+    inicio = time.perf_counter()
+    answer = qa_chain.combine_docs_chain.run(
+        input_documents=preparo["source_documents"],
+        question=preparo["pergunta_independente"] if qa_chain.rephrase_question else pergunta,
+        chat_history=preparo["historico"],
+        callbacks=callbacks
+    )
+    if answer_cache is not None and not preparo["historico"]:
+        answer_cache.armazenar(
+            preparo["pergunta_independente"], answer, preparo["fingerprint"], time.perf_counter() - inicio
+        )
+    if qa_chain.memory is not None:
+        qa_chain.memory.save_context({"question": pergunta}, {"answer": answer})
+    return {"question": pergunta, "answer": answer, "source_documents": preparo["source_documents"]}
+
+def responder_pergunta(qa_chain: ConversationalRetrievalChain, pergunta: str, chat_history: list,
+                       answer_cache: SemanticAnswerCache = None, callbacks: list = None) -> dict:
+    """
+    Responde a pergunta usando a cadeia de QA. Com um cache semântico, a
+    resposta de uma pergunta equivalente (mesmos chunks recuperados) é
+    devolvida sem chamar a LLM. Os callbacks (ex.: streaming de tokens)
+    são repassados à cadeia.
+
+    A pergunta reescrita sem depender do histórico é a chave do cache, para
+    que "e onde denuncio isso?" não receba a resposta de outra conversa, e
+    os documentos recuperados para o cache são os mesmos usados na resposta.
+    """
+    preparo = preparar_resposta(qa_chain, pergunta, chat_history, answer_cache=answer_cache, callbacks=callbacks)
+    if "answer" in preparo:
+        return {"question": pergunta, "answer": preparo["answer"],
+                "source_documents": preparo["source_documents"], "cache": True}
+    return gerar_resposta(qa_chain, preparo, answer_cache=answer_cache, callbacks=callbacks)
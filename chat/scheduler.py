@@ -0,0 +1,152 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+from config import ollama_max_paralelo, tamanho_max_fila, max_pedidos_por_usuario
+
+class FilaCheia(Exception):
+    """
+    Levantada quando a fila de inferência está cheia e o pedido é recusado.
+    """
+
+class Ticket:
+    """
+    Pedido de inferência na fila: guarda o usuário, a função a executar,
+    o Future com o resultado e os instantes de entrada e de início.
+    A função roda no contexto (contextvars) de quem a submeteu.
+    """
+
+    def __init__(self, usuario: str, funcao: Callable, args: tuple, kwargs: dict):
+        self.usuario = usuario
+        self.funcao = funcao
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.contexto = contextvars.copy_context()
+        self.enfileirado_em = time.monotonic()
+        self.iniciado_em: Optional[float] = None
+
+    @property
+    def iniciado(self) -> bool:
+        return self.iniciado_em is not None
+
+class InferenceScheduler:
+    """
+    Agenda as chamadas à LLM num pool fixo de workers (do tamanho que o host
+    do Ollama aguenta), com uma fila por usuário atendida em rodízio, para
+    que um usuário com muitos pedidos não atrase os demais.
+    Pedidos além de tamanho_max_fila (ou de max_por_usuario por usuário) são recusados.
+    """
+
+    def __init__(self, workers: int = ollama_max_paralelo, tamanho_max_fila: int = tamanho_max_fila,
+                 max_por_usuario: int = max_pedidos_por_usuario, janela_metricas: int = 500):
+        self.tamanho_max_fila = tamanho_max_fila
+        self.max_por_usuario = max_por_usuario
+        self._filas = OrderedDict()
+        self._cond = threading.Condition()
+        self._em_execucao = 0
+        self._esperas = deque(maxlen=janela_metricas)
+        self.atendidos = 0
+        self.rejeitados = 0
+        self.cancelados = 0
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"inferencia-{i}", daemon=True).start()
+
+    def _profundidade(self) -> int:
+        return sum(len(fila) for fila in self._filas.values())
+
+    def submeter(self, usuario: str, funcao: Callable, *args: Any, **kwargs: Any) -> Ticket:
+        """
+        Enfileira a chamada funcao(*args, **kwargs) para o usuário e devolve o ticket.
+        """
+        with self._cond:
+            fila = self._filas.get(usuario, ())
+            if self._profundidade() >= self.tamanho_max_fila or len(fila) >= self.max_por_usuario:
+                self.rejeitados += 1
+                logging.warning(f"Fila de inferência cheia: pedido de {usuario} recusado.")
+                raise FilaCheia()
+            ticket = Ticket(usuario, funcao, args, kwargs)
+            self._filas.setdefault(usuario, deque()).append(ticket)
+            self._cond.notify()
+            return ticket
+
+    def posicao(self, ticket: Ticket) -> int:
+        """
+        Posição do ticket na ordem de atendimento (1 = próximo); 0 se já começou.
+        """
+        with self._cond:
+            fila = self._filas.get(ticket.usuario)
+            if fila is None or ticket not in fila:
+                return 0
+            indice = fila.index(ticket)
+            usuarios = list(self._filas)
+            minha_vez = usuarios.index(ticket.usuario)
+            # Em cada rodada do rodízio cada usuário com pedidos é atendido uma vez
+            a_frente = indice
+            for ordem, usuario in enumerate(usuarios):
+                if usuario != ticket.usuario:
+                    rodadas = indice + (1 if ordem < minha_vez else 0)
+                    a_frente += min(len(self._filas[usuario]), rodadas)
+            return a_frente + 1
+
+    def cancelar(self, ticket: Ticket) -> bool:
+        """
+        Retira da fila um ticket que ainda não começou. Retorna False se ele já estiver em execução.
+        """
+        with self._cond:
+            fila = self._filas.get(ticket.usuario)
+            if fila is None or ticket not in fila:
+                return False
+            fila.remove(ticket)
+            if not fila:
+                del self._filas[ticket.usuario]
+            self.cancelados += 1
+        ticket.future.cancel()
+        return True
+
+    def _proximo(self) -> Ticket:
+        # Rodízio: atende o primeiro usuário e o manda para o fim da ordem
+        usuario, fila = next(iter(self._filas.items()))
+        ticket = fila.popleft()
+        del self._filas[usuario]
+        if fila:
+            self._filas[usuario] = fila
+        return ticket
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._filas:
+                    self._cond.wait()
+                ticket = self._proximo()
+                ticket.iniciado_em = time.monotonic()
+                self._esperas.append(ticket.iniciado_em - ticket.enfileirado_em)
+                self._em_execucao += 1
+
+            if ticket.future.set_running_or_notify_cancel():
+                try:
+                    ticket.future.set_result(ticket.contexto.run(ticket.funcao, *ticket.args, **ticket.kwargs))
+                except BaseException as e:
+                    ticket.future.set_exception(e)
+
+            with self._cond:
+                self._em_execucao -= 1
+                self.atendidos += 1
+
+    def estatisticas(self) -> dict:
+        with self._cond:
+            esperas = sorted(self._esperas)
+            return {
+                "profundidade_fila": self._profundidade(),
+                "em_execucao": self._em_execucao,
+                "usuarios_na_fila": len(self._filas),
+                "atendidos": self.atendidos,
+                "rejeitados": self.rejeitados,
+                "cancelados": self.cancelados,
+                "espera_p50_s": esperas[len(esperas) // 2] if esperas else 0.0,
+                "espera_p95_s": esperas[int(len(esperas) * 0.95)] if esperas else 0.0,
+                "espera_max_s": esperas[-1] if esperas else 0.0,
+            }
@@ -0,0 +1,79 @@
+import threading
+from collections import deque
+from typing import List
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from chat.context_packer import estimar_tokens
+from config import orcamento_tokens_historico, orcamento_tokens_resumo
+
+PREFIXO_RESUMO = "Resumo da conversa anterior: "
+
+def _truncar(texto: str, tokens: int) -> str:
+    """
+    Corta o texto para caber em `tokens` pela mesma estimativa do empacotador.
+    """
+    if estimar_tokens(texto) <= tokens:
+        return texto
+    if tokens <= 1:
+        return ""
+    return texto[:tokens * 4 - 2] + "…"
+
+class SessionMemory:
+    """
+    Memória de conversa de uma sessão, com orçamento fixo de tokens.
+
+    Os turnos mais recentes ficam numa janela deslizante; os que saem da janela
+    entram num resumo extrativo com as perguntas antigas. O resumo é montado
+    sem a LLM, para não gastar gerações fora da fila de inferência.
+    Um turno que sozinho não cabe na janela é truncado: o histórico entregue
+    à cadeia nunca passa de orcamento_tokens.
+    """
+
+    def __init__(self, orcamento_tokens: int = orcamento_tokens_historico,
+                 orcamento_resumo: int = orcamento_tokens_resumo):
+        self.orcamento_tokens = orcamento_tokens
+        self.orcamento_resumo = orcamento_resumo
+        self.turnos = deque()
+        self.resumo = ""
+        self._lock = threading.Lock()
+
+    def _tokens_janela(self) -> int:
+        return sum(estimar_tokens(p) + estimar_tokens(r) for p, r in self.turnos)
+
+    def adicionar(self, pergunta: str, resposta: str):
+        """
+        Registra um turno e move para o resumo os turnos que estouram o orçamento.
+        """
+        limite_janela = self.orcamento_tokens - self.orcamento_resumo
+        pergunta = _truncar(pergunta, limite_janela // 2)
+        resposta = _truncar(resposta, limite_janela - estimar_tokens(pergunta))
+        with self._lock:
+            self.turnos.append((pergunta, resposta))
+            antigos = []
+            while len(self.turnos) > 1 and self._tokens_janela() > limite_janela:
+                antigos.append(self.turnos.popleft())
+            if antigos:
+                self.resumo = self._resumo_extrativo(self.resumo, antigos)
+
+    def _resumo_extrativo(self, resumo: str, trechos: List[tuple]) -> str:
+        texto = " | ".join(filter(None, [resumo] + [pergunta for pergunta, _ in trechos]))
+        # Mantém as perguntas mais recentes; o prefixo da mensagem conta no orçamento
+        limite = (self.orcamento_resumo - estimar_tokens(PREFIXO_RESUMO)) * 4 - 1
+        return texto[-limite:] if limite > 0 else ""
+
+    def mensagens(self) -> List[BaseMessage]:
+        """
+        Histórico a ser injetado na cadeia: o resumo (se houver) e a janela recente.
+        """
+        with self._lock:
+            mensagens: List[BaseMessage] = []
+            if self.resumo:
+                mensagens.append(SystemMessage(content=PREFIXO_RESUMO + self.resumo))
+            for pergunta, resposta in self.turnos:
+                mensagens.append(HumanMessage(content=pergunta))
+                mensagens.append(AIMessage(content=resposta))
+            return mensagens
+
+    def limpar(self):
+        with self._lock:
+            self.turnos.clear()
+            self.resumo = ""
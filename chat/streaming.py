@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from langchain.callbacks.base import BaseCallbackHandler
+from metricas import registrar_span
+
+# Tag colocada na cadeia que gera a resposta final (ver build_retriever_chain)
+TAG_RESPOSTA = "resposta"
+
+class StreamlitTokenHandler(BaseCallbackHandler):
+    """
+    Escreve no placeholder do Streamlit os tokens da resposta à medida que a
+    LLM os gera. Só os tokens da cadeia marcada com TAG_RESPOSTA são exibidos
+    (a reescrita da pergunta e outras gerações são ignoradas).
+    Mede o tempo até o primeiro token desde o início do turno e desde o início
+    da geração da resposta.
+    Quando a cadeia roda fora da thread do script (fila de inferência), use
+    placeholder=None e exiba `texto` a partir da thread do script.
+    """
+
+    def __init__(self, placeholder=None, cursor: str = "▌"):
+        self.placeholder = placeholder
+        self.cursor = cursor
+        self.texto = ""
+        self.inicio_turno = time.perf_counter()
+        self.inicio_geracao = None
+        self.ttft = None
+        self.ttft_geracao = None
+        self.tokens = 0
+        self._runs_resposta = set()
+        self._runs_llm = set()
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, tags: Optional[List[str]] = None,
+                       **kwargs: Any) -> None:
+        if TAG_RESPOSTA in (tags or []) or parent_run_id in self._runs_resposta:
+            self._runs_resposta.add(run_id)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        if parent_run_id in self._runs_resposta:
+            self._runs_llm.add(run_id)
+            self.inicio_geracao = time.perf_counter()
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id not in self._runs_llm:
+            return
+        if self.ttft is None:
+            agora = time.perf_counter()
+            self.ttft = agora - self.inicio_turno
+            self.ttft_geracao = agora - self.inicio_geracao
+            logging.info(f"Primeiro token em {self.ttft:.2f}s (geração: {self.ttft_geracao:.2f}s).")
+        self.tokens += 1
+        self.texto += token
+        if self.placeholder is not None:
+            self.placeholder.markdown(self.texto + self.cursor)
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._runs_llm and self.placeholder is not None:
+            self.placeholder.markdown(self.texto)
+
+class GeracaoCancelada(Exception):
+    """
+    Levantada dentro da cadeia quando o turno foi abandonado (ex.: tempo máximo de resposta).
+    """
+
+class CancelamentoHandler(BaseCallbackHandler):
+    """
+    Interrompe a cadeia em andamento depois de cancelar(): a próxima chamada à
+    LLM, busca ou token levanta GeracaoCancelada. Isso encerra o streaming com
+    o Ollama e libera o worker da fila de inferência para o próximo pedido.
+    """
+
+    raise_error = True
+
+    def __init__(self):
+        self._cancelado = threading.Event()
+
+    def cancelar(self):
+        self._cancelado.set()
+
+    @property
+    def cancelado(self) -> bool:
+        return self._cancelado.is_set()
+
+    def _verificar(self):
+        if self._cancelado.is_set():
+            raise GeracaoCancelada()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self._verificar()
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, **kwargs: Any) -> None:
+        self._verificar()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self._verificar()
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Registra as chamadas à LLM como spans "llm_prefill" (até o primeiro token)
+    e "llm_geracao" (do primeiro token ao fim), com a contagem de tokens.
+    """
+
+    def __init__(self):
+        self._inicio = {}
+        self._primeiro_token = {}
+        self._tokens = defaultdict(int)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._inicio[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._primeiro_token.setdefault(run_id, time.perf_counter())
+        self._tokens[run_id] += 1
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        fim = time.perf_counter()
+        inicio = self._inicio.pop(run_id, fim)
+        primeiro = self._primeiro_token.pop(run_id, fim)
+        tokens = self._tokens.pop(run_id, 0)
+        # O Ollama informa as contagens exatas no último pedaço da resposta
+        info = {}
+        try:
+            info = response.generations[0][0].generation_info or {}
+        except (AttributeError, IndexError):
+            pass
+        registrar_span("llm_prefill", primeiro - inicio, inicio=inicio,
+                       tokens_prompt=info.get("prompt_eval_count"))
+        registrar_span("llm_geracao", fim - primeiro, inicio=primeiro,
+                       tokens_gerados=info.get("eval_count") or tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._inicio.pop(run_id, None)
+        self._primeiro_token.pop(run_id, None)
+        self._tokens.pop(run_id, None)
@@ -2,3 +2,86 @@
 modelo = "all-MiniLM-L6-v2"
 
 modelo_llm = "llama3.2:3b"
+
+# Cache em disco dos embeddings dos chunks (sobrevive à reconstrução do vectorstore)
+diretorio_cache_embeddings = "cache/embeddings"
+
+# Quantidade máxima de perguntas com embedding em cache (LRU) no caminho de consulta
+tamanho_cache_consultas = 1024
+
+# Cache semântico de respostas (similaridade mínima de cosseno, validade em segundos e nº de entradas)
+limiar_cache_respostas = 0.95
+ttl_cache_respostas = 3600
+tamanho_cache_respostas = 512
+
+# Busca: "hibrido" (BM25 + denso com reciprocal-rank fusion) ou "denso" (só o Chroma)
+modo_busca = "hibrido"
+arquivo_corpus = "content.jsonl"
+
+# Backend vetorial: "chroma", "numpy" (matriz float32 em disco) ou "numpy_int8" (quantizada)
+backend_vetorial = "chroma"
+diretorio_indice_numpy = "vectorstore/numpy"
+
+# Empacotamento do contexto: chunks candidatos buscados e orçamento aproximado de tokens no prompt
+# (abaixo dos ~500 tokens dos 4 chunks de até 500 caracteres do prompt original)
+k_candidatos_contexto = 8
+orcamento_tokens_contexto = 450
+
+# Reescrita da pergunta pelo histórico: "llm" (sempre gera), "auto" (só gera se a pergunta
+# depender do histórico) ou "local" (nunca gera; usa uma reescrita local barata)
+modo_condensacao = "local"
+
+# Memória por sessão: orçamento de tokens do histórico enviado à LLM (inclui o resumo extrativo)
+orcamento_tokens_historico = 400
+orcamento_tokens_resumo = 150
+
+# Fila de inferência: gerações simultâneas no Ollama (OLLAMA_NUM_PARALLEL do host), tamanho
+# máximo da fila, pedidos pendentes por usuário e tempos máximos (s) de espera na fila e de resposta
+ollama_max_paralelo = 1
+tamanho_max_fila = 20
+max_pedidos_por_usuario = 1
+tempo_max_fila = 60
+tempo_max_resposta = 180
+
+# Ollama: endereço da API HTTP, tempo que o modelo fica carregado após o último uso
+# e validade (s) do cache da lista de modelos disponíveis
+ollama_url = "http://localhost:11434"
+ollama_keep_alive = "30m"
+ttl_modelos_ollama = 60
+
+# Métricas por turno: log JSON dos spans, arquivo no formato do Prometheus (textfile collector),
+# tamanho da janela para os percentis e emails que veem o painel de métricas na barra lateral
+arquivo_log_metricas = "metrics/turnos.jsonl"
+arquivo_metricas_prometheus = "metrics/chat.prom"
+janela_metricas = 1000
+emails_admin = []
+
+# Armazenamento das conversas: "documento" (um documento por usuário com todas as mensagens)
+# ou "buckets" (documentos com até mensagens_por_bucket mensagens, em ordem de tempo).
+# No modo "buckets", conversas ainda não migradas (db/migrar_buckets.py) continuam sendo lidas
+# da coleção antiga.
+modo_armazenamento_conversas = "buckets"
+mensagens_por_bucket = 200
+colecao_buckets_conversas = "conversas_buckets"
+
+# Gravação das conversas em segundo plano (write-behind): turnos por bulk_write, intervalo
+# máximo (s) entre gravações e arquivo local com os turnos que não puderam ser gravados
+escrita_assincrona = True
+tamanho_lote_escrita = 50
+intervalo_escrita = 2.0
+arquivo_spill_conversas = "cache/conversas_pendentes.jsonl"
+
+# MongoDB: cliente único por processo. Tamanho do pool, tempo máximo (ms) de conexão ociosa,
+# timeouts (ms) de seleção de servidor, conexão e socket, e retentativa automática de leituras/escritas
+mongo_max_pool = 50
+mongo_min_pool = 0
+mongo_max_ocioso_ms = 300000
+mongo_timeout_selecao_ms = 5000
+mongo_timeout_conexao_ms = 5000
+mongo_timeout_socket_ms = 30000
+mongo_retry = True
+
+# Histórico exibido no chat: mensagens carregadas por página (no login e em "carregar anteriores")
+# e máximo de mensagens mantidas na sessão
+mensagens_por_pagina = 20
+max_mensagens_sessao = 200
@@ -0,0 +1,126 @@
+import atexit
+import logging
+import os
+import threading
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+from config import (
+    mongo_max_pool, mongo_min_pool, mongo_max_ocioso_ms, mongo_timeout_selecao_ms,
+    mongo_timeout_conexao_ms, mongo_timeout_socket_ms, mongo_retry
+)
+
+class EstatisticasPool(ConnectionPoolListener):
+    """
+    Contadores do pool de conexões de todos os clientes do registro:
+    conexões abertas/fechadas, checkouts, conexões em uso e tempos de
+    handshake e de espera por uma conexão livre.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {
+            "conexoes_criadas": 0, "conexoes_fechadas": 0, "checkouts": 0,
+            "checkouts_falhos": 0, "em_uso": 0, "pools_limpos": 0,
+            "handshake_total_s": 0.0, "espera_checkout_total_s": 0.0,
+        }
+
+    def _somar(self, **valores):
+        with self._lock:
+            for chave, valor in valores.items():
+                self.contadores[chave] += valor
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._somar(pools_limpos=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._somar(conexoes_criadas=1)
+
+    def connection_ready(self, event):
+        self._somar(handshake_total_s=getattr(event, "duration", None) or 0.0)
+
+    def connection_closed(self, event):
+        self._somar(conexoes_fechadas=1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._somar(checkouts_falhos=1)
+
+    def connection_checked_out(self, event):
+        self._somar(checkouts=1, em_uso=1, espera_checkout_total_s=getattr(event, "duration", None) or 0.0)
+
+    def connection_checked_in(self, event):
+        self._somar(em_uso=-1)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            dados = dict(self.contadores)
+        dados["conexoes_abertas"] = dados["conexoes_criadas"] - dados["conexoes_fechadas"]
+        dados["handshake_medio_s"] = dados["handshake_total_s"] / dados["conexoes_criadas"] if dados["conexoes_criadas"] else 0.0
+        dados["espera_checkout_media_s"] = dados["espera_checkout_total_s"] / dados["checkouts"] if dados["checkouts"] else 0.0
+        return dados
+
+_estatisticas = EstatisticasPool()
+_clientes = {}
+_clientes_lock = threading.Lock()
+
+def get_client(mongo_uri: str = None) -> MongoClient:
+    """
+    MongoClient compartilhado pelo processo (um por URI). A conexão só é aberta
+    na primeira operação; pool, timeouts e retentativas vêm do config.
+    Sem URI, usa a variável de ambiente MONGO_URI.
+    """
+    if mongo_uri is None:
+        load_dotenv()
+        mongo_uri = os.getenv("MONGO_URI")
+        if not mongo_uri:
+            raise ValueError("MONGO_URI não encontrada nas variáveis de ambiente")
+
+    with _clientes_lock:
+        client = _clientes.get(mongo_uri)
+        if client is None:
+            client = MongoClient(
+                mongo_uri,
+                connect=False,
+                maxPoolSize=mongo_max_pool,
+                minPoolSize=mongo_min_pool,
+                maxIdleTimeMS=mongo_max_ocioso_ms,
+                serverSelectionTimeoutMS=mongo_timeout_selecao_ms,
+                connectTimeoutMS=mongo_timeout_conexao_ms,
+                socketTimeoutMS=mongo_timeout_socket_ms,
+                retryReads=mongo_retry,
+                retryWrites=mongo_retry,
+                event_listeners=[_estatisticas],
+            )
+            _clientes[mongo_uri] = client
+            logging.info(f"Cliente MongoDB criado (pool máximo: {mongo_max_pool} conexões).")
+        return client
+
+def get_database(nome: str = "chat_bot", mongo_uri: str = None):
+    return get_client(mongo_uri)[nome]
+
+def estatisticas_pool() -> dict:
+    """
+    Estatísticas agregadas dos pools de conexão dos clientes do registro.
+    """
+    dados = _estatisticas.estatisticas()
+    dados["clientes"] = len(_clientes)
+    return dados
+
+@atexit.register
+def fechar_clientes():
+    with _clientes_lock:
+        for client in _clientes.values():
+            client.close()
+        _clientes.clear()
@@ -0,0 +1,161 @@
+# Índices do banco chat_bot: criação/verificação idempotente na inicialização
+# e um profiler que roda explain() em cada formato de consulta usado pelo app.
+#
+# Uso (a partir da raiz do projeto):
+#   python db/indices.py            # cria e verifica os índices
+#   python db/indices.py --perfil   # explain() das consultas; sai com código 1 se houver COLLSCAN ou plano
+#                                   # lento fora dos formatos já conhecidos (CONHECIDOS)
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from config import colecao_buckets_conversas
+
+# (coleção, nome, chaves, opções)
+INDICES = [
+    ("usuarios", "email_unico", [("email", ASCENDING)], {"unique": True}),
+    ("conversas", "cod", [("cod", ASCENDING)], {}),
+    ("conversas", "cod_mensagens_timestamp", [("cod", ASCENDING), ("mensagens.timestamp", ASCENDING)], {}),
+    (colecao_buckets_conversas, "cod_aberto", [("cod", ASCENDING)],
+     {"unique": True, "partialFilterExpression": {"aberto": True}}),
+    (colecao_buckets_conversas, "cod_fim_id", [("cod", ASCENDING), ("fim", DESCENDING), ("_id", DESCENDING)], {}),
+]
+
+def garantir_indices(db) -> list:
+    """
+    Cria os índices que faltam e confere os existentes (chaves e unicidade).
+    Pode ser chamada a cada inicialização. Retorna a lista de problemas encontrados.
+    """
+    problemas = []
+    for colecao, nome, chaves, opcoes in INDICES:
+        try:
+            db[colecao].create_index(chaves, name=nome, **opcoes)
+        except OperationFailure as e:
+            # Ex.: índice com as mesmas chaves e outro nome/opções, ou emails duplicados no índice único
+            problemas.append(f"{colecao}.{nome}: {e.details.get('errmsg', e) if e.details else e}")
+            continue
+        except PyMongoError as e:
+            # Sem conexão não adianta seguir; o app continua e tenta de novo no próximo processo
+            problemas.append(f"MongoDB indisponível: {e}")
+            break
+
+        info = db[colecao].index_information().get(nome)
+        if info is None or list(info["key"]) != chaves or bool(info.get("unique")) != bool(opcoes.get("unique")):
+            problemas.append(f"{colecao}.{nome}: índice existente difere do esperado ({info})")
+
+    for problema in problemas:
+        logging.error(f"Índice com problema: {problema}")
+    if not problemas:
+        logging.info(f"{len(INDICES)} índices verificados no MongoDB.")
+    return problemas
+
+# Alertas esperados por formato de consulta: aparecem no relatório, mas não fazem o profiler falhar.
+# A busca por similaridade usa regex sem âncora em mensagens.texto, que nenhum índice atende.
+CONHECIDOS = {
+    "conversas: similaridade (regex em mensagens.texto)": {"COLLSCAN"},
+    "buckets: similaridade (regex em mensagens.texto)": {"COLLSCAN"},
+}
+
+def consultas_do_app(db) -> list:
+    """
+    Formatos de consulta emitidos pelo app, com valores de exemplo tirados do próprio banco.
+    Cada item é (descrição, função que devolve o cursor).
+    """
+    usuario = db["usuarios"].find_one({}, {"email": 1, "senha": 1}) or {}
+    email, senha = usuario.get("email", "x@exemplo.com"), usuario.get("senha", "x")
+    cod = str(usuario["_id"]) if "_id" in usuario else "0"
+    desde = datetime.now() - timedelta(days=30)
+    termo = re.compile("violencia", re.IGNORECASE)
+    buckets = db[colecao_buckets_conversas]
+
+    return [
+        ("usuarios: cadastro (email)", lambda: db["usuarios"].find({"email": email}).limit(1)),
+        ("usuarios: login (email + senha)", lambda: db["usuarios"].find({"email": email, "senha": senha}).limit(1)),
+        ("conversas: documento do usuário (cod)", lambda: db["conversas"].find({"cod": cod}).limit(1)),
+        ("conversas: mensagens recentes (cod + mensagens.timestamp)", lambda: db["conversas"].find(
+            {"cod": cod, "mensagens": {"$elemMatch": {"timestamp": {"$gte": desde}}}}).limit(1)),
+        ("conversas: similaridade (regex em mensagens.texto)", lambda: db["conversas"].find(
+            {"mensagens.texto": {"$regex": termo}}).limit(20)),
+        ("buckets: upsert no bucket aberto (cod + aberto)", lambda: buckets.find(
+            {"cod": cod, "aberto": True}).limit(1)),
+        ("buckets: histórico (cod, sort fim)", lambda: buckets.find({"cod": cod}).sort("fim", DESCENDING).limit(10)),
+        ("buckets: página do histórico (cod + fim/_id, sort fim, $slice)", lambda: buckets.find(
+            {"cod": cod, "$or": [{"fim": {"$lt": desde}}, {"fim": desde, "_id": {"$lt": cod}}]},
+            {"mensagens": {"$slice": -20}, "n": 1, "fim": 1}).sort([("fim", DESCENDING), ("_id", DESCENDING)]).limit(20)),
+        ("buckets: posição de turnos da sessão (cod + mensagens.turno)", lambda: buckets.find(
+            {"cod": cod, "mensagens.turno": {"$in": ["0"]}}, {"mensagens.turno": 1, "mensagens.tipo": 1, "fim": 1})),
+        ("buckets: período (cod + fim, sort fim)", lambda: buckets.find(
+            {"cod": cod, "fim": {"$gte": desde}}).sort("fim", DESCENDING)),
+        ("buckets: similaridade (regex em mensagens.texto)", lambda: buckets.find(
+            {"mensagens.texto": {"$regex": termo}}).limit(20)),
+    ]
+
+def _estagios(plano) -> list:
+    """
+    Nomes de todos os estágios de um plano (percorre inputStage/inputStages/queryPlan).
+    """
+    estagios = []
+    if isinstance(plano, dict):
+        if "stage" in plano:
+            estagios.append(plano["stage"])
+        for valor in plano.values():
+            estagios += _estagios(valor)
+    elif isinstance(plano, list):
+        for item in plano:
+            estagios += _estagios(item)
+    return estagios
+
+def perfilar(db, limite_ms: int = 50) -> list:
+    """
+    Roda explain() em cada consulta do app e marca COLLSCAN, ordenação em memória
+    (SORT bloqueante) e planos mais lentos que limite_ms. Alertas listados em
+    CONHECIDOS vão para "alertas_conhecidos" em vez de "alertas".
+    """
+    relatorio = []
+    for descricao, consulta in consultas_do_app(db):
+        plano = consulta().explain()
+        estatisticas = plano.get("executionStats", {})
+        estagios = _estagios(plano.get("queryPlanner", {}).get("winningPlan", {}))
+        alertas = []
+        if "COLLSCAN" in estagios:
+            alertas.append("COLLSCAN")
+        if "SORT" in estagios:
+            alertas.append("SORT em memória")
+        if estatisticas.get("executionTimeMillis", 0) > limite_ms:
+            alertas.append(f"lento (>{limite_ms}ms)")
+        conhecidos = [alerta for alerta in alertas if alerta in CONHECIDOS.get(descricao, ())]
+        relatorio.append({
+            "consulta": descricao,
+            "estagios": estagios,
+            "tempo_ms": estatisticas.get("executionTimeMillis"),
+            "docs_examinados": estatisticas.get("totalDocsExamined"),
+            "docs_retornados": estatisticas.get("nReturned"),
+            "alertas": [alerta for alerta in alertas if alerta not in conhecidos],
+            "alertas_conhecidos": conhecidos,
+        })
+    return relatorio
+
+if __name__ == "__main__":
+    from db.mongo_client import db
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Índices e profiler de consultas do MongoDB")
+    parser.add_argument("--perfil", action="store_true", help="roda explain() nas consultas do app")
+    parser.add_argument("--limite-ms", type=int, default=50, help="tempo a partir do qual o plano é lento")
+    args = parser.parse_args()
+
+    problemas = garantir_indices(db)
+    if args.perfil:
+        relatorio = perfilar(db, args.limite_ms)
+        print(json.dumps(relatorio, ensure_ascii=False, indent=2))
+        sys.exit(1 if problemas or any(item["alertas"] for item in relatorio) else 0)
+    sys.exit(1 if problemas else 0)
@@ -1,11 +1,63 @@
 import streamlit as st
-from db.mongo_client import cadastrar_usuario, login_usuario, get_historico_usuario
+from config import mensagens_por_pagina, max_mensagens_sessao
+from db.mongo_client import cadastrar_usuario, login_usuario, get_pagina_historico, posicoes_turnos
 
 def clear_form():
     """Helper function to reset form"""
     st.session_state.form_submitted = True
     st.rerun()
 
+def carregar_historico(cursor: dict = None):
+    """
+    Coloca no início do chat_history a página de mensagens anterior ao cursor
+    (sem cursor, as mais recentes), sem passar de max_mensagens_sessao.
+    """
+    limite = min(mensagens_por_pagina, max_mensagens_sessao - len(st.session_state.chat_history))
+    if limite <= 0:
+        return
+    mensagens, st.session_state.historico_cursor = get_pagina_historico(
+        st.session_state.user["id"], cursor, limite
+    )
+    # Mapeia 'usuario' para 'user' e 'bot' permanece como 'bot'
+    st.session_state.chat_history = [
+        {"role": "user" if msg["tipo"] == "usuario" else "bot", "text": msg["texto"], "pos": msg["pos"]}
+        for msg in mensagens
+    ] + st.session_state.chat_history
+
+def limitar_historico():
+    """
+    Descarta as mensagens mais antigas da sessão acima de max_mensagens_sessao.
+    O cursor passa a apontar para elas, que podem ser carregadas de novo do banco.
+    Mensagens criadas na sessão recebem a posição no banco pelo id do turno; as
+    que ainda estão na fila de gravação ficam até o próximo turno, e as que
+    nunca são gravadas (ex.: mensagens de erro) saem sem mudar o cursor.
+    """
+    historico = st.session_state.chat_history
+    excesso = len(historico) - max_mensagens_sessao
+    if excesso <= 0:
+        return
+    candidatas = historico[:excesso + 1]
+    turnos = [msg["turno"] for msg in candidatas if "turno" in msg and "pos" not in msg]
+    posicoes = posicoes_turnos(st.session_state.user["id"], turnos) if turnos else {}
+    for msg in candidatas:
+        tipo = "usuario" if msg["role"] == "user" else "bot"
+        if (msg.get("turno"), tipo) in posicoes:
+            msg["pos"] = posicoes[(msg["turno"], tipo)]
+
+    descartar = 0
+    while descartar < excesso and ("pos" in historico[descartar] or "turno" not in historico[descartar]):
+        descartar += 1
+    if descartar == 0:
+        return
+    descartadas, st.session_state.chat_history = historico[:descartar], historico[descartar:]
+    mantida = st.session_state.chat_history[0].get("pos") if st.session_state.chat_history else None
+    ultima = next((msg["pos"] for msg in reversed(descartadas) if "pos" in msg), None)
+    if mantida:
+        st.session_state.historico_cursor = mantida
+    elif ultima:
+        # As anteriores à primeira mantida são a última descartada gravada e as que vieram antes
+        st.session_state.historico_cursor = dict(ultima, indice=ultima["indice"] + 1)
+
 def show_login_page():
     # Initialize session state for form control
     if 'form_submitted' not in st.session_state:
@@ -31,18 +83,9 @@ def show_login_page():
                     }
                     st.success(f"Bem vindo, {usuario['nome']}!")
                     
-                    # Carrega histórico de conversas
-                    historico = get_historico_usuario(st.session_state.user["id"])
-                    if historico:
-                        st.session_state.chat_history = []
-                        for conversa in historico:
-                            for msg in conversa["mensagens"]:
-                                # Mapeia 'usuario' para 'user' e 'bot' permanece como 'bot'
-                                role = "user" if msg["tipo"] == "usuario" else "bot"
-                                st.session_state.chat_history.append({
-                                    "role": role,
-                                    "text": msg["texto"]
-                                })
+                    # Carrega só a página mais recente do histórico; as anteriores vêm sob demanda
+                    st.session_state.chat_history = []
+                    carregar_historico()
                     st.rerun()
                 else:
                     st.error("Email ou senha inválidos")
@@ -0,0 +1,88 @@
+# Migra as conversas do formato antigo (um documento por usuário em "conversas")
+# para buckets de tamanho fixo, em ordem de tempo (config.colecao_buckets_conversas).
+#
+# Uso (a partir da raiz do projeto):
+#   python db/migrar_buckets.py --simular
+#   python db/migrar_buckets.py [--apagar-origem]
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import mensagens_por_bucket
+from db.mongo_client import colecao_conversas, colecao_buckets
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+def montar_buckets(usuario_id, mensagens, tamanho=mensagens_por_bucket, fechar_ultimo=False):
+    """
+    Divide as mensagens (ordenadas por timestamp) em buckets de até `tamanho` mensagens.
+    O último fica aberto para novas mensagens se tiver espaço para mais um turno, a
+    não ser com fechar_ultimo (o usuário já tem buckets mais novos que os migrados).
+    """
+    mensagens = sorted(mensagens, key=lambda m: m.get("timestamp") or datetime.min)
+    buckets = []
+    for inicio in range(0, len(mensagens), tamanho):
+        parte = mensagens[inicio:inicio + tamanho]
+        buckets.append({
+            "cod": usuario_id,
+            "n": len(parte),
+            "inicio": parte[0].get("timestamp"),
+            "fim": parte[-1].get("timestamp"),
+            "mensagens": parte,
+            "created_at": datetime.now(),
+            "migrado": True,
+            "aberto": False
+        })
+    if buckets and not fechar_ultimo and buckets[-1]["n"] + 2 <= tamanho:
+        buckets[-1]["aberto"] = True
+    return buckets
+
+def migrar(simular=False, apagar_origem=False):
+    """
+    Migra cada documento ainda não migrado. É idempotente: o documento de origem
+    recebe "migrado_buckets" e é ignorado nas próximas execuções; uma execução
+    interrompida é retomada a partir do primeiro bucket que faltou gravar.
+    """
+    usuarios, total_buckets, total_mensagens = 0, 0, 0
+    for conversa in colecao_conversas.find({"migrado_buckets": {"$ne": True}}):
+        usuario_id = conversa.get("cod")
+        mensagens = conversa.get("mensagens", [])
+        if usuario_id is None or not mensagens:
+            continue
+
+        ja_tem_buckets = colecao_buckets.count_documents({"cod": usuario_id, "migrado": {"$ne": True}}, limit=1) > 0
+        buckets = montar_buckets(usuario_id, mensagens, fechar_ultimo=ja_tem_buckets)
+        usuarios += 1
+        total_buckets += len(buckets)
+        total_mensagens += len(mensagens)
+        if simular:
+            continue
+
+        # Reexecução após uma falha no meio: insert_many é ordenado, então os buckets já
+        # gravados são os primeiros da lista e só falta o restante. Nada é apagado: o
+        # último bucket migrado pode estar aberto e já ter recebido mensagens novas.
+        ja_migrados = colecao_buckets.count_documents({"cod": usuario_id, "migrado": True})
+        if ja_migrados > len(buckets):
+            logging.warning(f"Usuário {usuario_id} já tem {ja_migrados} buckets migrados; esperados {len(buckets)}.")
+        elif buckets[ja_migrados:]:
+            colecao_buckets.insert_many(buckets[ja_migrados:])
+        if apagar_origem:
+            colecao_conversas.delete_one({"_id": conversa["_id"]})
+        else:
+            colecao_conversas.update_one({"_id": conversa["_id"]}, {"$set": {"migrado_buckets": True}})
+
+    acao = "Seriam migradas" if simular else "Migradas"
+    logging.info(f"{acao} {total_mensagens} mensagens de {usuarios} usuários em {total_buckets} buckets.")
+    return usuarios, total_buckets, total_mensagens
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra as conversas para o armazenamento em buckets")
+    parser.add_argument("--simular", action="store_true", help="só conta o que seria migrado")
+    parser.add_argument("--apagar-origem", action="store_true", help="remove os documentos antigos após migrar")
+    args = parser.parse_args()
+    migrar(simular=args.simular, apagar_origem=args.apagar_origem)
@@ -1,29 +1,20 @@
-import os
 import logging
-from pymongo import MongoClient
+from pymongo import UpdateOne
 from datetime import datetime
-from dotenv import load_dotenv
+from db.conexao import get_database
+from config import (
+    modo_armazenamento_conversas, mensagens_por_bucket, colecao_buckets_conversas, mensagens_por_pagina
+)
+from metricas import span
 
 
 def conectar():
     """
-    Estabelece conexão com o MongoDB usando variáveis de ambiente.
-    Retorna uma instância do banco de dados ou None em caso de erro.
+    Retorna o banco de dados usando o cliente compartilhado do processo
+    (ver db/conexao.py), ou None em caso de erro.
     """
     try:
-        # Carrega variáveis de ambiente
-        load_dotenv()
-        mongo_uri = os.getenv("MONGO_URI")
-        
-        if not mongo_uri:
-            raise ValueError("MONGO_URI não encontrada nas variáveis de ambiente")
-            
-        # Estabelece conexão
-        client = MongoClient(mongo_uri)
-        
-        # Seleciona o banco de dados
-        db = client["chat_bot"]
-        return db
+        return get_database("chat_bot")
     
     except Exception as e:
         print(f"Erro ao conectar ao MongoDB: {e}")
@@ -34,6 +25,7 @@ db = conectar()
 # Exemplo de uso das coleções
 colecao_usuarios = db["usuarios"]
 colecao_conversas = db["conversas"]
+colecao_buckets = db[colecao_buckets_conversas]
   
 def cadastrar_usuario(nome: str, telefone: str, senha: str, email: str, nascimento: str) -> tuple:
     """
@@ -88,10 +80,22 @@ def get_historico_usuario(usuario_id: str, limite: int = 10) -> list:
     Recupera o histórico de conversas do usuário.
     """
     try:
+        if modo_armazenamento_conversas == "buckets":
+            # Só os buckets mais recentes, devolvidos em ordem cronológica
+            buckets = list(colecao_buckets.find({"cod": usuario_id}).sort("fim", -1).limit(limite))
+            buckets.reverse()
+            if len(buckets) < limite:
+                # Conversas ainda não migradas (db/migrar_buckets.py) são anteriores aos buckets
+                buckets = list(colecao_conversas.find(
+                    {"cod": usuario_id, "migrado_buckets": {"$ne": True}}
+                ).limit(limite - len(buckets))) + buckets
+            logging.info(f"Recuperados {len(buckets)} buckets de conversa para o usuário {usuario_id}")
+            return buckets
+
         # Busca as últimas conversas do usuário
         conversas = list(colecao_conversas.find(
             {"cod": usuario_id}
-        ).sort("timestamp", -1).limit(limite))
+        ).sort("updated_at", -1).limit(limite))
         
         logging.info(f"Recuperadas {len(conversas)} conversas para o usuário {usuario_id}")
         return conversas
@@ -100,6 +104,100 @@ def get_historico_usuario(usuario_id: str, limite: int = 10) -> list:
         logging.error(f"Erro ao recuperar histórico: {e}")
         return []
 
+def _com_posicao(mensagens: list, inicio: int, **bucket) -> list:
+    # "pos" é o cursor que aponta para as mensagens anteriores a esta
+    for i, mensagem in enumerate(mensagens):
+        mensagem["pos"] = dict(bucket, indice=inicio + i)
+    return mensagens
+
+def _pagina_buckets(usuario_id, cursor: dict, limite: int) -> list:
+    paginas = []
+    faltam = limite
+    filtro = {"cod": usuario_id}
+    if cursor:
+        # Resto do bucket onde a página anterior parou
+        inicio = max(cursor["indice"] - faltam, 0)
+        if cursor["indice"] > inicio:
+            bucket = colecao_buckets.find_one(
+                {"_id": cursor["bucket"]},
+                {"mensagens": {"$slice": [inicio, cursor["indice"] - inicio]}}
+            )
+            if bucket:
+                paginas.append(_com_posicao(bucket["mensagens"], inicio, bucket=cursor["bucket"], fim=cursor["fim"]))
+                faltam -= len(bucket["mensagens"])
+        filtro["$or"] = [
+            {"fim": {"$lt": cursor["fim"]}},
+            {"fim": cursor["fim"], "_id": {"$lt": cursor["bucket"]}}
+        ]
+
+    if faltam > 0:
+        buckets = colecao_buckets.find(
+            filtro, {"mensagens": {"$slice": -faltam}, "n": 1, "fim": 1}
+        ).sort([("fim", -1), ("_id", -1)]).limit(faltam)
+        for bucket in buckets:
+            mensagens = bucket["mensagens"][-faltam:]
+            paginas.append(_com_posicao(
+                mensagens, bucket["n"] - len(mensagens), bucket=bucket["_id"], fim=bucket["fim"]
+            ))
+            faltam -= len(mensagens)
+            if faltam <= 0:
+                break
+
+    return [mensagem for pagina in reversed(paginas) for mensagem in pagina]
+
+def _pagina_documento(usuario_id, cursor: dict, limite: int, so_nao_migrados: bool = False) -> list:
+    filtro = {"cod": usuario_id}
+    if so_nao_migrados:
+        filtro["migrado_buckets"] = {"$ne": True}
+    if cursor:
+        fim = cursor["indice"]
+    else:
+        # Só o tamanho do array sai do servidor, não as mensagens
+        total = list(colecao_conversas.aggregate([
+            {"$match": filtro},
+            {"$project": {"total": {"$size": {"$ifNull": ["$mensagens", []]}}}},
+            {"$limit": 1}
+        ]))
+        fim = total[0]["total"] if total else 0
+    inicio = max(fim - limite, 0)
+    if fim <= inicio:
+        return []
+    conversa = colecao_conversas.find_one(filtro, {"mensagens": {"$slice": [inicio, fim - inicio]}})
+    return _com_posicao(conversa.get("mensagens", []), inicio) if conversa else []
+
+def get_pagina_historico(usuario_id: str, cursor: dict = None, limite: int = mensagens_por_pagina) -> tuple:
+    """
+    Página com até `limite` mensagens do usuário anteriores ao cursor (sem cursor,
+    as mais recentes), em ordem cronológica. Só as mensagens da página saem do
+    banco ($slice). Cada mensagem traz em "pos" o cursor para as anteriores a ela.
+    Retorna (mensagens, cursor da página anterior ou None se não houver mais).
+    """
+    # Uma mensagem a mais só para saber se existe página anterior
+    buscar = limite + 1
+    try:
+        if modo_armazenamento_conversas == "buckets":
+            mensagens = []
+            if not cursor or "bucket" in cursor:
+                mensagens = _pagina_buckets(usuario_id, cursor or {}, buscar)
+            if len(mensagens) < buscar:
+                # Depois dos buckets vêm as conversas ainda não migradas, no formato antigo
+                documento = cursor if cursor and "bucket" not in cursor else {}
+                mensagens = _pagina_documento(
+                    usuario_id, documento, buscar - len(mensagens), so_nao_migrados=True
+                ) + mensagens
+        else:
+            mensagens = _pagina_documento(usuario_id, cursor or {}, buscar)
+    except Exception as e:
+        logging.error(f"Erro ao recuperar histórico: {e}")
+        return [], None
+
+    proximo = None
+    if len(mensagens) > limite:
+        mensagens = mensagens[-limite:]
+        proximo = mensagens[0]["pos"]
+    logging.info(f"Recuperadas {len(mensagens)} mensagens do histórico do usuário {usuario_id}")
+    return mensagens, proximo
+
 def listar_pessoas():
   try:
     print("\nPessoas:")
@@ -220,33 +318,134 @@ def conversas_usuarios(bd):
 
     return list(colecao_conversas.aggregate(agregacao))
 
-def armazenar_conversas(bd, usuario_id, pergunta, resposta):
+def _upsert_bucket(usuario_id, mensagens: list) -> tuple:
+    # Só há um bucket aberto por usuário (índice único parcial em db/indices.py). Ele é
+    # fechado (aberto: False) na escrita que não deixa espaço para outro turno do
+    # mesmo tamanho; a escrita seguinte cria um bucket novo pelo upsert.
+    filtro = {"cod": usuario_id, "aberto": True}
+    atualizacao = [
+        {"$set": {
+            "mensagens": {"$concatArrays": [{"$ifNull": ["$mensagens", []]}, {"$literal": mensagens}]},
+            "n": {"$add": [{"$ifNull": ["$n", 0]}, len(mensagens)]},
+            "inicio": {"$min": ["$inicio", {"$literal": mensagens[0]["timestamp"]}]},
+            "fim": {"$max": ["$fim", {"$literal": mensagens[-1]["timestamp"]}]},
+            "created_at": {"$ifNull": ["$created_at", {"$literal": datetime.now()}]}
+        }},
+        {"$set": {"aberto": {"$lte": [{"$add": ["$n", len(mensagens)]}, mensagens_por_bucket]}}}
+    ]
+    return filtro, atualizacao
+
+def armazenar_bucket(usuario_id, mensagens: list):
+    """
+    Acrescenta as mensagens ao bucket aberto do usuário numa única operação atômica.
+    Se não houver bucket aberto, o upsert cria um novo.
+    """
+    filtro, atualizacao = _upsert_bucket(usuario_id, mensagens)
+    return colecao_buckets.update_one(filtro, atualizacao, upsert=True)
+
+def operacao_conversa(usuario_id, mensagens: list) -> tuple:
+    """
+    Operação de escrita (para bulk_write) que grava as mensagens de um turno no modo
+    de armazenamento configurado. Retorna (coleção, UpdateOne).
+    """
+    if modo_armazenamento_conversas == "buckets":
+        filtro, atualizacao = _upsert_bucket(usuario_id, mensagens)
+        return colecao_buckets, UpdateOne(filtro, atualizacao, upsert=True)
+    return colecao_conversas, UpdateOne(
+        {"cod": usuario_id},
+        {
+            "$push": {"mensagens": {"$each": mensagens}},
+            "$set": {"updated_at": datetime.now()},
+            "$setOnInsert": {"created_at": datetime.now()}
+        },
+        upsert=True
+    )
+
+def turnos_gravados(turnos: list) -> set:
+    """
+    Ids dos turnos (campo "turno" das mensagens) que já estão no banco, entre os
+    turnos informados ({"usuario_id", "mensagens"}). Usado ao regravar turnos cuja
+    gravação anterior falhou sem saber se chegou a ser aplicada.
+    """
+    ids = {turno["mensagens"][0].get("turno") for turno in turnos} - {None}
+    if not ids:
+        return set()
+    colecao = colecao_buckets if modo_armazenamento_conversas == "buckets" else colecao_conversas
+    encontrados = set()
+    documentos = colecao.find(
+        {"cod": {"$in": list({turno["usuario_id"] for turno in turnos})}, "mensagens.turno": {"$in": list(ids)}},
+        {"mensagens.turno": 1}
+    )
+    for documento in documentos:
+        encontrados.update(mensagem.get("turno") for mensagem in documento.get("mensagens", []))
+    return encontrados & ids
+
+def posicoes_turnos(usuario_id, turnos: list) -> dict:
+    """
+    Posição no banco ("pos", o mesmo cursor de get_pagina_historico) das mensagens
+    dos turnos informados, por (turno, tipo). Turnos ainda não gravados ficam de fora.
+    """
+    turnos = set(turnos)
+    if not turnos:
+        return {}
+    filtro = {"cod": usuario_id, "mensagens.turno": {"$in": list(turnos)}}
+    projecao = {"mensagens.turno": 1, "mensagens.tipo": 1, "fim": 1}
+    posicoes = {}
+    if modo_armazenamento_conversas == "buckets":
+        for bucket in colecao_buckets.find(filtro, projecao):
+            for indice, mensagem in enumerate(bucket.get("mensagens", [])):
+                if mensagem.get("turno") in turnos:
+                    posicoes[(mensagem["turno"], mensagem["tipo"])] = dict(
+                        bucket=bucket["_id"], fim=bucket["fim"], indice=indice
+                    )
+    else:
+        conversa = colecao_conversas.find_one(filtro, projecao) or {}
+        for indice, mensagem in enumerate(conversa.get("mensagens", [])):
+            if mensagem.get("turno") in turnos:
+                posicoes[(mensagem["turno"], mensagem["tipo"])] = dict(indice=indice)
+    return posicoes
+
+def armazenar_conversas(bd, usuario_id, pergunta, resposta, turno_id: str = None):
+    # Com turno_id, as mensagens levam o campo "turno" (ver posicoes_turnos)
+    turno = {"turno": turno_id} if turno_id else {}
     try:
-        # Procura documento existente do usuário
-        conversa = colecao_conversas.find_one({"cod": usuario_id})
-        
-        nova_mensagem = [
-            {"tipo": "usuario", "texto": pergunta, "timestamp": datetime.now()},
-            {"tipo": "bot", "texto": resposta, "timestamp": datetime.now()}
-        ]
-        
-        if conversa:
-            # Atualiza documento existente
-            resultado = colecao_conversas.update_one(
-                {"cod": usuario_id},
-                {"$push": {"mensagens": {"$each": nova_mensagem}}}
-            )
-            return resultado.modified_count > 0
-        else:
-            # Cria novo documento
-            conversa = {
-                "cod": usuario_id,
-                "mensagens": nova_mensagem,
-                "created_at": datetime.now(),
-                "updated_at": datetime.now()
-            }
-            resultado = colecao_conversas.insert_one(conversa)
-            return resultado.inserted_id
+        if modo_armazenamento_conversas == "buckets":
+            with span("mongo_escrita", operacao="upsert_bucket"):
+                agora = datetime.now()
+                resultado = armazenar_bucket(usuario_id, [
+                    {"tipo": "usuario", "texto": pergunta, "timestamp": agora, **turno},
+                    {"tipo": "bot", "texto": resposta, "timestamp": agora, **turno}
+                ])
+                return resultado.upserted_id or resultado.modified_count > 0
+
+        with span("mongo_escrita") as atributos:
+            # Procura documento existente do usuário
+            conversa = colecao_conversas.find_one({"cod": usuario_id})
+            
+            nova_mensagem = [
+                {"tipo": "usuario", "texto": pergunta, "timestamp": datetime.now(), **turno},
+                {"tipo": "bot", "texto": resposta, "timestamp": datetime.now(), **turno}
+            ]
+            
+            if conversa:
+                # Atualiza documento existente
+                atributos["operacao"] = "update"
+                resultado = colecao_conversas.update_one(
+                    {"cod": usuario_id},
+                    {"$push": {"mensagens": {"$each": nova_mensagem}}}
+                )
+                return resultado.modified_count > 0
+            else:
+                # Cria novo documento
+                atributos["operacao"] = "insert"
+                conversa = {
+                    "cod": usuario_id,
+                    "mensagens": nova_mensagem,
+                    "created_at": datetime.now(),
+                    "updated_at": datetime.now()
+                }
+                resultado = colecao_conversas.insert_one(conversa)
+                return resultado.inserted_id
 
     except Exception as e:
         logging.error(f"Erro ao armazenar conversa: {e}")
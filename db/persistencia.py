@@ -0,0 +1,179 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from config import tamanho_lote_escrita, intervalo_escrita, arquivo_spill_conversas
+from metricas import registro, span
+from db.mongo_client import operacao_conversa, turnos_gravados
+
+class PersistenciaConversas:
+    """
+    Gravação das conversas em segundo plano (write-behind).
+
+    enfileirar() só coloca o turno numa fila em memória; uma thread grava os
+    turnos com bulk_write quando junta tamanho_lote turnos ou a cada intervalo
+    segundos. Se o MongoDB falhar, os turnos vão para um arquivo local (spill)
+    e são regravados nas próximas rodadas. Ao encerrar o processo, a fila é esvaziada.
+    Cada turno tem um id (campo "turno" das mensagens): ao regravar o spill, os
+    turnos que já chegaram ao banco numa tentativa anterior são ignorados.
+    """
+
+    def __init__(self, tamanho_lote: int = tamanho_lote_escrita, intervalo: float = intervalo_escrita,
+                 arquivo_spill: str = arquivo_spill_conversas):
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.arquivo_spill = arquivo_spill
+        self.gravados = 0
+        self.falhas = 0
+        self.atraso_s = 0.0
+        self._fila = queue.Queue()
+        # O spill é escrito pela thread de gravação e por fechar()
+        self._lock_spill = threading.RLock()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="persistencia-conversas", daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    def enfileirar(self, usuario_id, pergunta: str, resposta: str, turno_id: str = None):
+        """
+        Registra um turno para gravação. Não bloqueia. O turno_id (gerado se
+        omitido) permite achar depois a posição das mensagens no banco.
+        """
+        agora = datetime.now()
+        turno_id = turno_id or uuid.uuid4().hex
+        self._fila.put({
+            "usuario_id": usuario_id,
+            "mensagens": [
+                {"tipo": "usuario", "texto": pergunta, "timestamp": agora, "turno": turno_id},
+                {"tipo": "bot", "texto": resposta, "timestamp": agora, "turno": turno_id}
+            ],
+            "enfileirado_em": time.monotonic()
+        })
+
+    def _coletar(self) -> list:
+        lote = []
+        prazo = time.monotonic() + self.intervalo
+        while len(lote) < self.tamanho_lote:
+            try:
+                turno = self._fila.get(timeout=max(prazo - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if turno is None:
+                break
+            lote.append(turno)
+        return lote
+
+    def _loop(self):
+        while not (self._parar.is_set() and self._fila.empty()):
+            lote = self._coletar()
+            if os.path.exists(self.arquivo_spill):
+                self._regravar_spill()
+            if lote and os.path.exists(self.arquivo_spill):
+                # Mantém a ordem: enquanto houver turnos antigos no spill, os novos vão para o fim dele
+                self._salvar_spill(lote)
+            elif lote:
+                self._gravar(lote)
+            registro.definir_gauge("chat_persistencia_pendentes", self._fila.qsize())
+            registro.definir_gauge("chat_persistencia_atraso_segundos", round(self.atraso_s, 3))
+
+    def _bulk_write(self, lote: list) -> int:
+        """
+        Grava o lote em ordem e retorna quantos turnos foram gravados antes de uma falha.
+        """
+        por_colecao = {}
+        for turno in lote:
+            colecao, operacao = operacao_conversa(turno["usuario_id"], turno["mensagens"])
+            por_colecao.setdefault(colecao.name, (colecao, []))[1].append(operacao)
+        try:
+            with span("mongo_bulk_write", operacoes=len(lote)):
+                for colecao, operacoes in por_colecao.values():
+                    colecao.bulk_write(operacoes, ordered=True)
+            return len(lote)
+        except BulkWriteError as e:
+            # Em lotes ordenados, tudo antes da primeira operação com erro foi aplicado
+            erros = e.details.get("writeErrors") or [{"index": 0}]
+            return erros[0]["index"] if len(por_colecao) == 1 else 0
+
+    def _gravar(self, lote: list):
+        gravados = 0
+        try:
+            gravados = self._bulk_write(lote)
+        except Exception as e:
+            logging.warning(f"Falha ao gravar {len(lote)} turnos no MongoDB: {e}")
+        self.gravados += gravados
+        self.atraso_s = time.monotonic() - min(turno["enfileirado_em"] for turno in lote)
+        if gravados < len(lote):
+            self.falhas += 1
+            self._salvar_spill(lote[gravados:])
+
+    def _salvar_spill(self, turnos: list):
+        with self._lock_spill:
+            os.makedirs(os.path.dirname(self.arquivo_spill) or ".", exist_ok=True)
+            with open(self.arquivo_spill, "a", encoding="utf-8") as f:
+                for turno in turnos:
+                    f.write(json.dumps({"usuario_id": turno["usuario_id"], "mensagens": turno["mensagens"]},
+                                       ensure_ascii=False, default=datetime.isoformat) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        logging.warning(f"{len(turnos)} turnos salvos em {self.arquivo_spill} para nova tentativa.")
+
+    def _regravar_spill(self):
+        with self._lock_spill:
+            with open(self.arquivo_spill, encoding="utf-8") as f:
+                turnos = [json.loads(linha) for linha in f if linha.strip()]
+            for turno in turnos:
+                for mensagem in turno["mensagens"]:
+                    mensagem["timestamp"] = datetime.fromisoformat(mensagem["timestamp"])
+            try:
+                # Uma falha no meio de um bulk_write não diz o que já foi aplicado; como os
+                # $push não são idempotentes, os turnos já gravados ficam de fora
+                ja_gravados = turnos_gravados(turnos)
+                pendentes = [t for t in turnos if t["mensagens"][0].get("turno") not in ja_gravados]
+                gravados = self._bulk_write(pendentes) if pendentes else 0
+            except Exception as e:
+                logging.warning(f"MongoDB ainda indisponível, {len(turnos)} turnos continuam no spill: {e}")
+                return
+            os.remove(self.arquivo_spill)
+            if gravados < len(pendentes):
+                self._salvar_spill([dict(t, enfileirado_em=time.monotonic()) for t in pendentes[gravados:]])
+            else:
+                logging.info(
+                    f"{gravados} turnos do spill gravados no MongoDB "
+                    f"({len(turnos) - len(pendentes)} já estavam gravados)."
+                )
+            self.gravados += gravados
+
+    def fechar(self, timeout: float = 10.0):
+        """
+        Grava o que ainda estiver na fila. O que não couber no tempo vai para o spill.
+        """
+        if self._parar.is_set():
+            return
+        self._parar.set()
+        self._fila.put(None)
+        self._thread.join(timeout)
+        restantes = []
+        while True:
+            try:
+                turno = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if turno is not None:
+                restantes.append(turno)
+        if restantes:
+            self._salvar_spill(restantes)
+
+    def estatisticas(self) -> dict:
+        return {
+            "pendentes": self._fila.qsize(),
+            "gravados": self.gravados,
+            "falhas": self.falhas,
+            "atraso_s": self.atraso_s,
+            "spill": os.path.exists(self.arquivo_spill),
+        }
@@ -0,0 +1,142 @@
+# Corpus de chunks em disco com acesso aleatório por (source, chunk_id)
+import json
+import mmap
+import os
+import threading
+
+class ChunkCorpus:
+    """
+    Corpus de chunks em um arquivo JSONL append-only com um índice lateral
+    (`<arquivo>.idx`) que guarda o offset e o tamanho de cada registro.
+
+    Cada linha do índice é um array JSON [source, chunk_id, offset, tamanho];
+    tamanho 0 marca a remoção do chunk. Vale sempre a última entrada de cada
+    chave, então regravar um chunk só acrescenta dados ao fim dos arquivos.
+    A leitura de um chunk é O(1) via mmap, sem carregar o arquivo inteiro.
+    """
+
+    def __init__(self, jsonl_path: str, index_path: str = None):
+        self.jsonl_path = jsonl_path
+        self.index_path = index_path or jsonl_path + ".idx"
+        self._lock = threading.Lock()
+        self._mapa = None
+        self._indice = {}
+        self._carregar_indice()
+
+    def _carregar_indice(self):
+        self._indice = {}
+        if not os.path.exists(self.index_path):
+            return
+        tamanho_dados = os.path.getsize(self.jsonl_path) if os.path.exists(self.jsonl_path) else 0
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    source, chunk_id, offset, tamanho = json.loads(linha)
+                except ValueError:
+                    # Linha incompleta de uma gravação interrompida
+                    continue
+                if tamanho == 0:
+                    self._indice.pop((source, chunk_id), None)
+                elif offset + tamanho <= tamanho_dados:
+                    self._indice[(source, chunk_id)] = (offset, tamanho)
+
+    def _mmap(self):
+        tamanho = os.path.getsize(self.jsonl_path) if os.path.exists(self.jsonl_path) else 0
+        if tamanho == 0:
+            return None
+        if self._mapa is None or len(self._mapa) < tamanho:
+            if self._mapa is not None:
+                self._mapa.close()
+            with open(self.jsonl_path, "rb") as f:
+                self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mapa
+
+    def adicionar(self, chunks):
+        """
+        Acrescenta os chunks ao corpus. Um chunk com a mesma chave substitui o anterior.
+        """
+        entradas = []
+        with self._lock:
+            with open(self.jsonl_path, "ab") as f:
+                for chunk in chunks:
+                    registro = json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n"
+                    offset = f.tell()
+                    f.write(registro)
+                    metadata = chunk["metadata"]
+                    entradas.append((metadata["source"], metadata["chunk_id"], offset, len(registro)))
+            # O índice é gravado depois dos dados: uma entrada nunca aponta para bytes ausentes.
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                for source, chunk_id, offset, tamanho in entradas:
+                    f.write(json.dumps([source, chunk_id, offset, tamanho], ensure_ascii=False) + "\n")
+                    self._indice[(source, chunk_id)] = (offset, tamanho)
+
+    def remover_source(self, source: str):
+        """
+        Marca como removidos todos os chunks de um arquivo de origem.
+        """
+        with self._lock:
+            chaves = [chave for chave in self._indice if chave[0] == source]
+            if not chaves:
+                return
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                for chave in chaves:
+                    f.write(json.dumps([source, chave[1], 0, 0], ensure_ascii=False) + "\n")
+                    del self._indice[chave]
+
+    def get(self, source: str, chunk_id: int):
+        """
+        Retorna o chunk (dicionário com 'content' e 'metadata') ou None.
+        """
+        with self._lock:
+            posicao = self._indice.get((source, chunk_id))
+            if posicao is None:
+                return None
+            offset, tamanho = posicao
+            return json.loads(self._mmap()[offset:offset + tamanho])
+
+    def sources(self):
+        return {source for source, _ in self._indice}
+
+    def __contains__(self, chave):
+        return chave in self._indice
+
+    def __len__(self):
+        return len(self._indice)
+
+    def __iter__(self):
+        """
+        Percorre os chunks válidos na ordem do arquivo, lendo linha a linha.
+        """
+        if not os.path.exists(self.jsonl_path):
+            return
+        with self._lock:
+            validos = {offset for offset, _ in self._indice.values()}
+        with open(self.jsonl_path, "rb") as f:
+            offset = 0
+            for linha in f:
+                if offset in validos:
+                    yield json.loads(linha)
+                offset += len(linha)
+
+    def compactar(self):
+        """
+        Reescreve o corpus só com os chunks válidos, descartando versões antigas.
+        """
+        tmp = ChunkCorpus(self.jsonl_path + ".tmp", self.index_path + ".tmp")
+        for caminho in (tmp.jsonl_path, tmp.index_path):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        tmp.adicionar(iter(self))
+        with self._lock:
+            if self._mapa is not None:
+                self._mapa.close()
+                self._mapa = None
+            os.replace(tmp.jsonl_path, self.jsonl_path)
+            os.replace(tmp.index_path, self.index_path)
+        self._carregar_indice()
+
+    def fechar(self):
+        with self._lock:
+            if self._mapa is not None:
+                self._mapa.close()
+                self._mapa = None
@@ -0,0 +1,187 @@
+# Cache persistente de embeddings em disco
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List
+import numpy as np
+from langchain.embeddings import HuggingFaceEmbeddings
+from langchain.embeddings.base import Embeddings
+from config import modelo, diretorio_cache_embeddings, tamanho_cache_consultas
+from metricas import registro, span
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Normaliza o texto para a chave do cache (Unicode NFC e espaços colapsados).
+    """
+    return " ".join(unicodedata.normalize("NFC", texto).split())
+
+def normalizar_consulta(texto: str) -> str:
+    """
+    Normaliza uma pergunta para a chave do cache de consultas
+    (além de normalizar_texto, ignora maiúsculas e pontuação final).
+    """
+    return normalizar_texto(texto).casefold().rstrip(" ?!.")
+
+def hash_texto_normalizado(texto: str) -> str:
+    return hashlib.sha256(normalizar_texto(texto).encode("utf-8")).hexdigest()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envolve um modelo de embeddings com um cache em disco.
+
+    Os vetores ficam em um arquivo float32 contíguo (lido via memmap) e o
+    índice hash -> linha em um arquivo texto com um hash por linha. Apenas os
+    textos ausentes do cache são enviados ao modelo, em um único lote.
+    """
+
+    def __init__(self, embedding_model: Embeddings, model_name: str, cache_dir: str):
+        self.embedding_model = embedding_model
+        self.model_name = model_name
+        self.cache_dir = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_name))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._vetores_path = os.path.join(self.cache_dir, "vetores.f32")
+        self._indice_path = os.path.join(self.cache_dir, "indice.txt")
+        self._meta_path = os.path.join(self.cache_dir, "meta.json")
+        self._lock = threading.Lock()
+        self._matriz = None
+        self._dim = None
+        self._indice = {}
+        self._linhas = 0
+        self._carregar()
+
+    def _carregar(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            self._dim = json.load(f)["dim"]
+
+        # Os vetores são gravados antes do índice: só valem as linhas presentes nos dois.
+        linhas_vetores = os.path.getsize(self._vetores_path) // (4 * self._dim) \
+            if os.path.exists(self._vetores_path) else 0
+        if os.path.exists(self._indice_path):
+            with open(self._indice_path, "r", encoding="utf-8") as f:
+                for linha, chave in enumerate(f):
+                    if linha >= linhas_vetores:
+                        break
+                    self._indice[chave.strip()] = linha
+                    self._linhas = linha + 1
+        logging.info(f"Cache de embeddings carregado: {len(self._indice)} vetores em {self.cache_dir}")
+
+    def _mapear(self):
+        if self._matriz is None or self._matriz.shape[0] < self._linhas:
+            self._matriz = np.memmap(self._vetores_path, dtype=np.float32, mode="r", shape=(self._linhas, self._dim))
+        return self._matriz
+
+    def _gravar(self, chaves: List[str], vetores: List[List[float]]):
+        matriz = np.asarray(vetores, dtype=np.float32)
+        if self._dim is None:
+            self._dim = int(matriz.shape[1])
+            with open(self._meta_path, "w", encoding="utf-8") as f:
+                json.dump({"modelo": self.model_name, "dim": self._dim}, f)
+
+        inicio = self._linhas
+        with open(self._vetores_path, "ab") as f:
+            # Descarta um eventual resto de uma gravação interrompida
+            f.truncate(inicio * 4 * self._dim)
+            f.write(matriz.tobytes())
+        with open(self._indice_path, "a", encoding="utf-8") as f:
+            f.writelines(f"{chave}\n" for chave in chaves)
+        for offset, chave in enumerate(chaves):
+            self._indice[chave] = inicio + offset
+        self._linhas = inicio + len(chaves)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        chaves = [hash_texto_normalizado(texto) for texto in texts]
+        with self._lock:
+            faltantes = {}
+            for chave, texto in zip(chaves, texts):
+                if chave not in self._indice and chave not in faltantes:
+                    faltantes[chave] = texto
+            if faltantes:
+                vetores = self.embedding_model.embed_documents(list(faltantes.values()))
+                self._gravar(list(faltantes.keys()), vetores)
+            logging.info(f"Cache de embeddings: {len(texts) - len(faltantes)} acertos, {len(faltantes)} calculados")
+            if not chaves:
+                return []
+            matriz = self._mapear()
+            return [matriz[self._indice[chave]].tolist() for chave in chaves]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embedding_model.embed_query(text)
+
+class QueryEmbeddingCache(Embeddings):
+    """
+    Cache LRU em memória, de tamanho limitado, para os embeddings das consultas.
+    A chave é a pergunta normalizada; embed_documents é repassado ao modelo.
+    """
+
+    def __init__(self, embedding_model: Embeddings, tamanho: int = tamanho_cache_consultas):
+        self.embedding_model = embedding_model
+        self.tamanho = tamanho
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding_model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with span("embedding") as atributos:
+            return self._embed_query(text, atributos)
+
+    def _embed_query(self, text: str, atributos: dict) -> List[float]:
+        chave = normalizar_consulta(text)
+        with self._lock:
+            vetor = self._cache.get(chave)
+            if vetor is not None:
+                self._cache.move_to_end(chave)
+                self.hits += 1
+                atributos["cache_hit"] = True
+                return vetor
+            self.misses += 1
+
+        atributos["cache_hit"] = False
+        vetor = self.embedding_model.embed_query(text)
+        with self._lock:
+            self._cache[chave] = vetor
+            self._cache.move_to_end(chave)
+            while len(self._cache) > self.tamanho:
+                self._cache.popitem(last=False)
+        return vetor
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "tamanho": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": self.hits / total if total else 0.0,
+            }
+
+@lru_cache(maxsize=None)
+def get_embedding_model(cache_dir: str = diretorio_cache_embeddings) -> CachedEmbeddings:
+    """
+    Retorna o modelo de embeddings configurado (config.modelo) com cache em disco.
+    A instância é compartilhada por todo o processo.
+    """
+    return CachedEmbeddings(HuggingFaceEmbeddings(model_name=modelo), modelo, cache_dir)
+
+@lru_cache(maxsize=None)
+def get_query_embedding_model() -> QueryEmbeddingCache:
+    """
+    Retorna o modelo de embeddings do caminho de consulta: o modelo com cache
+    em disco envolvido pelo cache LRU de perguntas. Compartilhado pelo processo;
+    os acertos do cache entram nas métricas exportadas.
+    """
+    modelo_consultas = QueryEmbeddingCache(get_embedding_model(), tamanho_cache_consultas)
+    registro.registrar_estatisticas("cache_embeddings_consultas", modelo_consultas.estatisticas)
+    return modelo_consultas
@@ -2,20 +2,48 @@
 import logging
 from langchain.vectorstores import Chroma
 from langchain.schema.document import Document
+from documents.manifest import chunk_id_estavel
+
+# Quantidade de chunks enviados ao Chroma por chamada
+TAMANHO_LOTE = 1000
+
+def abrir_vectorstore(persist_directory, embedding_model):
+    """
+    Abre (ou cria) o ChromaDB persistido no diretório informado.
+    """
+    return Chroma(
+        persist_directory=persist_directory,
+        embedding_function=embedding_model
+    )
+
+def upsert_chunks(vectordb, chunks, ids=None):
+    """
+    Insere ou atualiza os chunks no ChromaDB usando ids estáveis,
+    de modo que reprocessar um chunk não duplica o vetor.
+    """
+    if ids is None:
+        ids = [chunk_id_estavel(chunk) for chunk in chunks]
+    for inicio in range(0, len(chunks), TAMANHO_LOTE):
+        lote = chunks[inicio:inicio + TAMANHO_LOTE]
+        documents = [
+            Document(page_content=chunk["content"], metadata=chunk["metadata"])
+            for chunk in lote
+        ]
+        vectordb.add_documents(documents, ids=ids[inicio:inicio + TAMANHO_LOTE])
+
+def remover_chunks(vectordb, ids):
+    """
+    Remove do ChromaDB os vetores com os ids informados.
+    """
+    ids = list(ids)
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        vectordb.delete(ids=ids[inicio:inicio + TAMANHO_LOTE])
 
 def embeddar(chunks, persist_directory, embedding_model):
     """
     Gera embeddings para os chunks e os armazena no ChromaDB local.
     """
-    documents = [
-        Document(page_content=chunk["content"], metadata=chunk["metadata"])
-        for chunk in chunks
-    ]
-
-    vectordb = Chroma.from_documents(
-        documents,
-        embedding_model,
-        persist_directory=persist_directory
-    )
+    vectordb = abrir_vectorstore(persist_directory, embedding_model)
+    upsert_chunks(vectordb, chunks)
     vectordb.persist()
     logging.info(f"Embeddings armazenados em: {persist_directory}")
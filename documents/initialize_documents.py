@@ -1,25 +1,69 @@
 # Executa o pré-processamento dos documentos
 import logging
-from langchain.embeddings import HuggingFaceEmbeddings
-from processor import extract_text, chunking, save_jsonl
-from embedding_store import embeddar
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import backend_vetorial, diretorio_indice_numpy
+from documents.corpus_store import ChunkCorpus
+from documents.numpy_index import exportar_chroma
+from documents.embedding_cache import get_embedding_model
+from documents.embedding_store import abrir_vectorstore, remover_chunks
+from documents.manifest import carregar_manifesto, salvar_manifesto, comparar_arquivos
+from documents.pipeline import executar_pipeline
 
 FILES_DIR = "files"
 OUTPUT_JSONL = "content.jsonl"
 CHROMA_DIR = "vectorstore"
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+MANIFEST_PATH = os.path.join(CHROMA_DIR, "manifest.json")
+embedding_model = get_embedding_model()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
     logging.info("Iniciando processamento dos arquivos PDF...")
 
-    raw_docs = extract_text(FILES_DIR)
-    logging.info(f"{len(raw_docs)} documentos extraídos.")
+    manifesto = carregar_manifesto(MANIFEST_PATH)
+    alterados, hashes, removidos = comparar_arquivos(FILES_DIR, manifesto)
+    logging.info(f"{len(alterados)} arquivos novos ou alterados, {len(removidos)} removidos.")
+
+    corpus = ChunkCorpus(OUTPUT_JSONL)
+    # Arquivos já indexados mas ausentes do corpus (ex.: content.jsonl apagado)
+    # são reprocessados; os embeddings deles continuam vindo do vectorstore.
+    # Os que não geraram chunks nunca entram no corpus e ficam de fora.
+    sem_chunks = {filename for filename, info in manifesto["arquivos"].items() if not info["chunks"]}
+    fora_do_corpus = set(hashes) - corpus.sources() - set(alterados) - sem_chunks
+    alterados = sorted(set(alterados) | fora_do_corpus)
+
+    vectordb = abrir_vectorstore(CHROMA_DIR, embedding_model)
+    if not manifesto["arquivos"]:
+        # Sem manifesto não há como saber quais vetores já existem (ex.: os de ids
+        # aleatórios das versões anteriores); reindexar por cima deles duplicaria o corpus.
+        ids_antigos = vectordb.get(include=[])["ids"]
+        if ids_antigos:
+            logging.info(f"Manifesto ausente: removendo {len(ids_antigos)} vetores antigos do vectorstore.")
+            remover_chunks(vectordb, ids_antigos)
 
-    chunks = chunking(raw_docs)
-    logging.info(f"{len(chunks)} chunks gerados.")
+    for filename in removidos:
+        remover_chunks(vectordb, manifesto["arquivos"][filename]["chunks"])
+        corpus.remover_source(filename)
+        del manifesto["arquivos"][filename]
 
-    save_jsonl(chunks, OUTPUT_JSONL)
+    executar_pipeline(
+        FILES_DIR,
+        vectordb,
+        manifesto,
+        hashes,
+        arquivos=alterados,
+        corpus=corpus
+    )
 
-    embeddar(chunks, CHROMA_DIR, embedding_model)
+    vectordb.persist()
+    salvar_manifesto(manifesto, MANIFEST_PATH)
+    if alterados or removidos:
+        corpus.compactar()
+    if backend_vetorial != "chroma" and (alterados or removidos or not os.path.exists(diretorio_indice_numpy)):
+        exportar_chroma(vectordb, diretorio_indice_numpy)
 
     logging.info("Inicialização de documentos concluída com sucesso.")
@@ -0,0 +1,66 @@
+# Manifesto com os hashes dos arquivos e chunks já indexados
+import hashlib
+import json
+import logging
+import os
+
+def hash_arquivo(file_path, tamanho_bloco=1 << 20):
+    """
+    Calcula o SHA-256 do conteúdo de um arquivo lendo em blocos.
+    """
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def hash_texto(texto):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+def chunk_id_estavel(chunk):
+    """
+    Gera o id estável de um chunk: source + chunk_id + hash do conteúdo.
+    """
+    metadata = chunk["metadata"]
+    return f"{metadata['source']}:{metadata['chunk_id']}:{hash_texto(chunk['content'])[:16]}"
+
+def carregar_manifesto(manifest_path):
+    """
+    Carrega o manifesto do disco. Retorna um manifesto vazio se ele não existir.
+    """
+    if not os.path.exists(manifest_path):
+        return {"arquivos": {}}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Manifesto inválido em {manifest_path}, reindexando tudo: {e}")
+        return {"arquivos": {}}
+
+def salvar_manifesto(manifesto, manifest_path):
+    """
+    Grava o manifesto de forma atômica (arquivo temporário + rename).
+    """
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def comparar_arquivos(folder_path, manifesto):
+    """
+    Compara os PDFs da pasta com o manifesto.
+    Retorna (alterados, hashes, removidos): arquivos novos ou modificados,
+    o hash atual de cada PDF e os arquivos que saíram da pasta.
+    """
+    hashes = {}
+    for filename in os.listdir(folder_path):
+        if filename.lower().endswith(".pdf"):
+            hashes[filename] = hash_arquivo(os.path.join(folder_path, filename))
+
+    indexados = manifesto["arquivos"]
+    alterados = sorted(
+        filename for filename, h in hashes.items()
+        if indexados.get(filename, {}).get("hash") != h
+    )
+    removidos = sorted(set(indexados) - set(hashes))
+    return alterados, hashes, removidos
@@ -0,0 +1,84 @@
+# Normalização de texto usada na ingestão e na busca lexical
+import logging
+import re
+import string
+from functools import lru_cache
+from unidecode import unidecode
+
+# "compat" (padrão): mesma saída do word_tokenize do NLTK (mantém válidos os índices já gerados).
+# "rapido": tokenização por regex e stopwords sem acento; muda a saída, então exige
+# reprocessar e reindexar todo o corpus antes de ser ativado.
+MODO_NORMALIZACAO = "compat"
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.,/-][a-z0-9]+)*")
+
+@lru_cache(maxsize=None)
+def recurso_nltk(caminho, pacote):
+    """
+    Garante que um recurso do NLTK existe, baixando-o só no primeiro uso
+    (nunca na importação dos módulos).
+    """
+    import nltk
+    try:
+        nltk.data.find(caminho)
+    except LookupError:
+        logging.info(f"Baixando o recurso '{pacote}' do NLTK...")
+        nltk.download(pacote, quiet=True)
+
+def recurso_tokenizador():
+    """
+    Garante o modelo do word_tokenize: "punkt_tab" a partir do NLTK 3.8.2
+    (que não lê mais o "punkt" em pickle) e "punkt" nas versões anteriores.
+    """
+    from nltk.tokenize import punkt
+    if hasattr(punkt, "PunktTokenizer"):
+        recurso_nltk("tokenizers/punkt_tab", "punkt_tab")
+    else:
+        recurso_tokenizador()
+
+@lru_cache(maxsize=None)
+def _stopwords(idioma, sem_acento=False):
+    recurso_nltk("corpora/stopwords", "stopwords")
+    from nltk.corpus import stopwords
+    palavras = stopwords.words(idioma)
+    if sem_acento:
+        palavras = (unidecode(palavra) for palavra in palavras)
+    return frozenset(palavras)
+
+def carregar_stopwords(idioma='portuguese'):
+    """
+    Stopwords do NLTK para o idioma (com acentos), carregadas uma única vez.
+    """
+    return _stopwords(idioma)
+
+def preprocess_text(text, idioma='portuguese', modo=MODO_NORMALIZACAO):
+    """
+    Remove acentuação, stopwords e pontuação do texto.
+    No modo "compat", levanta LookupError se o tokenizador do NLTK não estiver
+    instalado e não puder ser baixado.
+    """
+    # Remover acentuação
+    if not text.isascii():
+        text = unidecode(text)
+    text = text.lower()
+
+    if modo == "compat":
+        recurso_tokenizador()
+        from nltk.tokenize import word_tokenize
+        stop_words = _stopwords(idioma)
+        tokens = word_tokenize(text, language=idioma)
+        tokens_filtrados = [
+            palavra for palavra in tokens
+            if palavra not in stop_words and palavra not in string.punctuation
+        ]
+        return " ".join(tokens_filtrados)
+
+    stop_words = _stopwords(idioma, sem_acento=True)
+    return " ".join(palavra for palavra in _TOKEN.findall(text) if palavra not in stop_words)
+
+def preprocess_batch(texts, idioma='portuguese', modo=MODO_NORMALIZACAO):
+    """
+    Aplica preprocess_text a uma lista de textos numa única chamada
+    (usado para distribuir lotes de documentos entre processos).
+    """
+    return [preprocess_text(text, idioma, modo) for text in texts]
@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema.document import Document
+from langchain.schema.vectorstore import VectorStore
+from documents.corpus_store import ChunkCorpus
+
+# Linhas processadas por vez na busca sobre a matriz int8 (limita a cópia em float32)
+LINHAS_POR_BLOCO = 65536
+
+def _normalizar(matriz: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    normas[normas == 0] = 1
+    return matriz / normas
+
+def _salvar_npy(caminho: str, matriz: np.ndarray):
+    # Troca atômica: quem já mapeou o arquivo antigo continua lendo a versão anterior
+    with open(caminho + ".tmp", "wb") as f:
+        np.save(f, matriz)
+    os.replace(caminho + ".tmp", caminho)
+
+def _gravar_matrizes(matriz: np.ndarray, diretorio: str):
+    """
+    Grava a matriz float32 normalizada (vetores.npy) e a variante quantizada
+    em int8 com uma escala por linha (vetores_int8.npy, escalas.npy).
+    """
+    escalas = np.abs(matriz).max(axis=1) / 127
+    escalas[escalas == 0] = 1
+    quantizada = np.round(matriz / escalas[:, None]).astype(np.int8)
+
+    _salvar_npy(os.path.join(diretorio, "vetores.npy"), matriz)
+    _salvar_npy(os.path.join(diretorio, "vetores_int8.npy"), quantizada)
+    _salvar_npy(os.path.join(diretorio, "escalas.npy"), escalas.astype(np.float32))
+
+def _gravar_chaves(chaves: List[Tuple[str, int]], diretorio: str):
+    caminho = os.path.join(diretorio, "chaves.json")
+    with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+        json.dump([list(chave) for chave in chaves], f, ensure_ascii=False)
+    os.replace(caminho + ".tmp", caminho)
+
+def construir_indice_numpy(vetores, chunks: Iterable[dict], diretorio: str):
+    """
+    Grava um índice vetorial no diretório: a matriz float32 normalizada
+    (vetores.npy), a variante quantizada em int8 com uma escala por linha
+    (vetores_int8.npy, escalas.npy) e os chunks na mesma ordem das linhas.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    matriz = _normalizar(np.asarray(vetores, dtype=np.float32))
+    _gravar_matrizes(matriz, diretorio)
+
+    corpus_path = os.path.join(diretorio, "chunks.jsonl")
+    for caminho in (corpus_path, corpus_path + ".idx"):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    corpus = ChunkCorpus(corpus_path)
+    chunks = list(chunks)
+    corpus.adicionar(chunks)
+    corpus.fechar()
+    _gravar_chaves([(chunk["metadata"]["source"], chunk["metadata"]["chunk_id"]) for chunk in chunks], diretorio)
+    logging.info(f"Índice NumPy gravado em {diretorio}: {matriz.shape[0]} vetores de dimensão {matriz.shape[1]}.")
+
+def exportar_chroma(vectordb, diretorio: str, lote: int = 5000):
+    """
+    Exporta os vetores, textos e metadados de uma coleção do Chroma para um índice NumPy.
+    """
+    vetores, chunks = [], []
+    offset = 0
+    while True:
+        dados = vectordb.get(include=["embeddings", "documents", "metadatas"], limit=lote, offset=offset)
+        if not dados["ids"]:
+            break
+        vetores.extend(dados["embeddings"])
+        chunks.extend(
+            {"content": texto, "metadata": metadata}
+            for texto, metadata in zip(dados["documents"], dados["metadatas"])
+        )
+        offset += len(dados["ids"])
+    if not vetores:
+        logging.warning("Nenhum vetor encontrado no Chroma para exportar.")
+        return
+    construir_indice_numpy(vetores, chunks, diretorio)
+
+class NumpyVectorStore(VectorStore):
+    """
+    Vectorstore sobre uma matriz de embeddings mapeada do disco.
+    A busca é exata: um único produto matriz-vetor seguido de argpartition.
+    Com quantizado=True usa a matriz int8 (4x menor) com as escalas por linha.
+    add_texts regrava as matrizes a cada chamada: serve para acréscimos pequenos;
+    para reindexar o corpus, use exportar_chroma após a ingestão.
+    """
+
+    def __init__(self, diretorio: str, embedding_function: Embeddings, quantizado: bool = False):
+        self.diretorio = diretorio
+        self.embedding_function = embedding_function
+        self.quantizado = quantizado
+        self._lock = threading.Lock()
+        self._carregar()
+        self._corpus = ChunkCorpus(os.path.join(diretorio, "chunks.jsonl"))
+        logging.info(f"Índice NumPy carregado de {diretorio}: {len(self._chaves)} vetores (int8={quantizado}).")
+
+    def _carregar(self):
+        if self.quantizado:
+            matriz = np.load(os.path.join(self.diretorio, "vetores_int8.npy"), mmap_mode="r")
+            escalas = np.load(os.path.join(self.diretorio, "escalas.npy"))
+        else:
+            matriz = np.load(os.path.join(self.diretorio, "vetores.npy"), mmap_mode="r")
+            escalas = None
+        with open(os.path.join(self.diretorio, "chaves.json"), "r", encoding="utf-8") as f:
+            # Chaves antes da matriz: buscas em andamento só veem linhas que já têm chave
+            self._chaves = [tuple(chave) for chave in json.load(f)]
+        self._matriz, self._escalas = matriz, escalas
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding_function
+
+    def _scores(self, consulta: np.ndarray) -> np.ndarray:
+        if not self.quantizado:
+            return self._matriz @ consulta
+        scores = np.empty(self._matriz.shape[0], dtype=np.float32)
+        for inicio in range(0, self._matriz.shape[0], LINHAS_POR_BLOCO):
+            bloco = self._matriz[inicio:inicio + LINHAS_POR_BLOCO].astype(np.float32)
+            scores[inicio:inicio + LINHAS_POR_BLOCO] = bloco @ consulta
+        return scores * self._escalas
+
+    def busca_por_vetor(self, embedding: List[float], k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Retorna até k pares (linha, similaridade de cosseno), do mais similar ao menos.
+        """
+        consulta = _normalizar(np.asarray(embedding, dtype=np.float32))
+        scores = self._scores(consulta)
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return []
+        if k < scores.shape[0]:
+            linhas = np.argpartition(-scores, k - 1)[:k]
+        else:
+            linhas = np.arange(scores.shape[0])
+        linhas = linhas[np.argsort(-scores[linhas])]
+        return [(int(linha), float(scores[linha])) for linha in linhas]
+
+    def _documento(self, linha: int) -> Document:
+        chunk = self._corpus.get(*self._chaves[linha])
+        return Document(page_content=chunk["content"], metadata=chunk["metadata"])
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        return [(self._documento(linha), score) for linha, score in self.busca_por_vetor(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding_function.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # Similaridade de cosseno em [-1, 1] -> relevância em [0, 1]
+        return lambda score: (score + 1) / 2
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        """
+        Calcula os embeddings dos textos e os grava no índice. Um chunk com o
+        mesmo (source, chunk_id) de outro já indexado substitui a linha dele.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        with self._lock:
+            metadatas = metadatas or [{"source": "", "chunk_id": len(self._chaves) + i} for i in range(len(texts))]
+            vetores = _normalizar(np.asarray(self.embedding_function.embed_documents(texts), dtype=np.float32))
+            matriz = np.array(np.load(os.path.join(self.diretorio, "vetores.npy")))
+            chaves = list(self._chaves)
+            linhas = {chave: linha for linha, chave in enumerate(chaves)}
+            novas = []
+            for metadata, vetor in zip(metadatas, vetores):
+                chave = (metadata["source"], metadata["chunk_id"])
+                if chave in linhas:
+                    matriz[linhas[chave]] = vetor
+                    continue
+                linhas[chave] = len(chaves)
+                chaves.append(chave)
+                novas.append(vetor)
+            if novas:
+                matriz = np.vstack([matriz, np.asarray(novas, dtype=np.float32)])
+
+            # Corpus antes das matrizes: uma linha nova nunca aponta para um chunk ausente
+            self._corpus.adicionar([
+                {"content": texto, "metadata": metadata} for texto, metadata in zip(texts, metadatas)
+            ])
+            _gravar_matrizes(matriz, self.diretorio)
+            _gravar_chaves(chaves, self.diretorio)
+            self._carregar()
+        logging.info(f"{len(texts)} textos gravados no índice NumPy ({len(novas)} linhas novas).")
+        return [f"{metadata['source']}:{metadata['chunk_id']}" for metadata in metadatas]
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   diretorio: str = "vectorstore/numpy", quantizado: bool = False,
+                   **kwargs: Any) -> "NumpyVectorStore":
+        metadatas = metadatas or [{"source": "", "chunk_id": i} for i in range(len(texts))]
+        chunks = [{"content": texto, "metadata": metadata} for texto, metadata in zip(texts, metadatas)]
+        construir_indice_numpy(embedding.embed_documents(list(texts)), chunks, diretorio)
+        return cls(diretorio, embedding, quantizado=quantizado)
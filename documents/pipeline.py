@@ -0,0 +1,129 @@
+# Pipeline de ingestão em lotes: extração -> pré-processamento -> chunking -> embeddings
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from documents.processor import iter_raw_documents, preprocess_batch, chunking
+from documents.embedding_store import upsert_chunks, remover_chunks
+from documents.manifest import chunk_id_estavel
+
+# Quantidade de documentos que atravessam o pipeline de cada vez
+TAMANHO_LOTE_DOCS = 8
+
+def lotes(iteravel, tamanho):
+    """
+    Agrupa um iterável em listas de até `tamanho` elementos, sem materializá-lo.
+    """
+    iterador = iter(iteravel)
+    while True:
+        lote = list(islice(iterador, tamanho))
+        if not lote:
+            return
+        yield lote
+
+def _indexar_lote(vectordb, chunks, manifesto, indexados, hashes):
+    """
+    Envia ao vectorstore apenas os chunks ainda não indexados do lote,
+    remove os obsoletos e atualiza o manifesto dos arquivos do lote.
+    """
+    ids_por_arquivo = defaultdict(list)
+    novos_chunks, novos_ids = [], []
+    for chunk in chunks:
+        source = chunk["metadata"]["source"]
+        chunk_id = chunk_id_estavel(chunk)
+        ids_por_arquivo[source].append(chunk_id)
+        if chunk_id not in indexados.get(source, ()):
+            novos_chunks.append(chunk)
+            novos_ids.append(chunk_id)
+
+    upsert_chunks(vectordb, novos_chunks, novos_ids)
+
+    for source, ids in ids_por_arquivo.items():
+        obsoletos = indexados.get(source, set()) - set(ids)
+        if obsoletos:
+            remover_chunks(vectordb, obsoletos)
+        manifesto["arquivos"][source] = {"hash": hashes[source], "chunks": ids}
+    return len(novos_chunks)
+
+def executar_pipeline(folder_path, vectordb, manifesto, hashes, arquivos=None,
+                      corpus=None, tamanho_lote=TAMANHO_LOTE_DOCS, max_workers=None):
+    """
+    Processa os PDFs em lotes de `tamanho_lote` documentos. Cada lote passa por
+    extração, pré-processamento, chunking e indexação antes do próximo ser lido,
+    de modo que a memória usada não cresce com o tamanho da pasta.
+    Se um ChunkCorpus for informado, os chunks de cada arquivo processado
+    substituem os anteriores no corpus. Arquivos processados que não geram
+    nenhum chunk saem do vectorstore e do corpus e ficam no manifesto com
+    zero chunks, para não serem extraídos de novo enquanto não mudarem.
+    Registra no log o progresso e a vazão de cada etapa por lote.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    indexados = {
+        source: set(info["chunks"]) for source, info in manifesto["arquivos"].items()
+    }
+
+    total_docs = total_chunks = total_novos = 0
+    com_chunks = set()
+    inicio_total = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        docs_brutos = iter_raw_documents(folder_path, pool, max_workers, arquivos)
+        t0 = time.perf_counter()
+        for numero, lote in enumerate(lotes(docs_brutos, tamanho_lote), start=1):
+            t_extracao = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            textos = [doc["content"] for doc in lote]
+            por_processo = -(-len(textos) // max_workers)
+            conteudos = [
+                conteudo
+                for parte in pool.map(preprocess_batch, lotes(textos, por_processo))
+                for conteudo in parte
+            ]
+            docs = [
+                {"source": doc["source"], "content": conteudo}
+                for doc, conteudo in zip(lote, conteudos)
+            ]
+            t_preprocessamento = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            chunks = chunking(docs)
+            t_chunking = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            if corpus is not None:
+                for doc in docs:
+                    corpus.remover_source(doc["source"])
+                corpus.adicionar(chunks)
+            novos = _indexar_lote(vectordb, chunks, manifesto, indexados, hashes)
+            com_chunks.update(chunk["metadata"]["source"] for chunk in chunks)
+            t_embeddings = time.perf_counter() - t0
+
+            total_docs += len(docs)
+            total_chunks += len(chunks)
+            total_novos += novos
+            logging.info(
+                f"Lote {numero}: {len(docs)} docs, {len(chunks)} chunks ({novos} novos) | "
+                f"extração {t_extracao:.2f}s ({len(docs) / max(t_extracao, 1e-9):.1f} docs/s), "
+                f"pré-processamento {t_preprocessamento:.2f}s ({len(docs) / max(t_preprocessamento, 1e-9):.1f} docs/s), "
+                f"chunking {t_chunking:.2f}s ({len(chunks) / max(t_chunking, 1e-9):.1f} chunks/s), "
+                f"embeddings {t_embeddings:.2f}s ({novos / max(t_embeddings, 1e-9):.1f} chunks/s) | "
+                f"total: {total_docs} docs, {total_chunks} chunks"
+            )
+            t0 = time.perf_counter()
+
+    processados = set(arquivos) if arquivos is not None else set(hashes)
+    for source in sorted(processados - com_chunks):
+        logging.info(f"{source} não gerou chunks; removendo os vetores anteriores.")
+        remover_chunks(vectordb, indexados.get(source, ()))
+        manifesto["arquivos"][source] = {"hash": hashes[source], "chunks": []}
+        if corpus is not None:
+            corpus.remover_source(source)
+
+    duracao = time.perf_counter() - inicio_total
+    logging.info(
+        f"Pipeline concluído em {duracao:.2f}s: {total_docs} docs, "
+        f"{total_chunks} chunks, {total_novos} enviados ao vectorstore."
+    )
+    return total_docs, total_chunks, total_novos
@@ -1,53 +1,146 @@
 # Funções para extrair, limpar e chunkar os textos
 import logging
 import os
-import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
-import string
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from unidecode import unidecode
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from documents.corpus_store import ChunkCorpus
+from documents.normalizer import preprocess_text, preprocess_batch
 
-# Baixar os recursos necessários do NLTK
-nltk.download('stopwords')
-nltk.download('punkt')
+# PDFs com mais páginas que isso são divididos em várias tarefas no modo paralelo
+PAGINAS_POR_TAREFA = 50
 
-def preprocess_text(text, idioma='portuguese'):
+def _listar_pdfs(folder_path, arquivos=None):
+    pdfs = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(".pdf"))
+    if arquivos is not None:
+        arquivos = set(arquivos)
+        pdfs = [f for f in pdfs if f in arquivos]
+    return pdfs
+
+def _ler_paginas(file_path, inicio, fim):
     """
-    Remove acentuação, stopwords e pontuação do texto.
+    Lê o texto das páginas [inicio, fim) de um PDF. Executado nos processos do pool.
     """
-    # Remover acentuação
-    text = unidecode(text)
-    
-    # Tokenização e filtragem
-    stop_words = set(stopwords.words(idioma))
-    tokens = word_tokenize(text.lower(), language=idioma)
-    tokens_filtrados = [
-        palavra for palavra in tokens
-        if palavra not in stop_words and palavra not in string.punctuation
-    ]
-    return " ".join(tokens_filtrados)
+    with fitz.open(file_path) as pdf:
+        return [pdf[i].get_text() for i in range(inicio, min(fim, pdf.page_count))]
+
+def _intervalos_paginas(file_path, paginas_por_tarefa):
+    with fitz.open(file_path) as pdf:
+        total = pdf.page_count
+    return [(inicio, min(inicio + paginas_por_tarefa, total))
+            for inicio in range(0, total, paginas_por_tarefa)]
 
-def extract_text(folder_path):
+def _submeter_leituras(pool, tarefas, janela):
     """
-    Extrai texto de todos os arquivos PDF da pasta.
-    Retorna uma lista de dicionários com 'source' e 'content' (pré-processado).
+    Submete as leituras de páginas ao pool mantendo no máximo `janela` em execução
+    e devolve (tarefa, future) na ordem original.
     """
-    docs = []
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(".pdf"):
-            file_path = os.path.join(folder_path, filename)
+    pendentes = deque()
+    for tarefa in tarefas:
+        pendentes.append((tarefa, pool.submit(_ler_paginas, *tarefa[1:])))
+        if len(pendentes) >= janela:
+            yield pendentes.popleft()
+    while pendentes:
+        yield pendentes.popleft()
+
+def _tarefas_paginas(folder_path, paginas_por_tarefa, arquivos=None):
+    for filename in _listar_pdfs(folder_path, arquivos):
+        file_path = os.path.join(folder_path, filename)
+        try:
+            intervalos = _intervalos_paginas(file_path, paginas_por_tarefa)
+        except Exception as e:
+            logging.warning(f"Erro ao processar {filename}: {e}")
+            continue
+        for inicio, fim in intervalos:
+            yield (filename, file_path, inicio, fim)
+
+def _stream_pages(pool, folder_path, janela, paginas_por_tarefa, arquivos=None):
+    falhas = set()
+    tarefas = _tarefas_paginas(folder_path, paginas_por_tarefa, arquivos)
+    for (filename, _, inicio, _), future in _submeter_leituras(pool, tarefas, janela):
+        if filename in falhas:
+            continue
+        try:
+            paginas = future.result()
+        except Exception as e:
+            logging.warning(f"Erro ao processar {filename}: {e}")
+            falhas.add(filename)
+            continue
+        for offset, texto in enumerate(paginas):
+            yield {"source": filename, "page": inicio + offset, "content": texto}
+
+def stream_pages(folder_path, max_workers=None, paginas_por_tarefa=PAGINAS_POR_TAREFA, arquivos=None):
+    """
+    Extrai o texto bruto dos PDFs da pasta em paralelo (um pool de processos).
+    PDFs grandes são divididos em blocos de páginas. As páginas são devolvidas
+    em ordem, como um stream de dicionários com 'source', 'page' e 'content'.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        yield from _stream_pages(pool, folder_path, max_workers * 2, paginas_por_tarefa, arquivos)
+
+def iter_raw_documents(folder_path, pool=None, max_workers=None, arquivos=None):
+    """
+    Gera, um por vez, dicionários com 'source' e 'content' (texto bruto, sem
+    pré-processamento) para os PDFs da pasta. Se um pool de processos for
+    informado, as páginas são lidas em paralelo (max_workers deve ser o
+    tamanho desse pool).
+    """
+    if pool is None:
+        for filename in _listar_pdfs(folder_path, arquivos):
             try:
-                with fitz.open(file_path) as pdf:
-                    text = ""
-                    for page in pdf:
-                        text += page.get_text()
-                    texto_preprocessado = preprocess_text(text)
-                    docs.append({"source": filename, "content": texto_preprocessado})
+                with fitz.open(os.path.join(folder_path, filename)) as pdf:
+                    text = "".join(page.get_text() for page in pdf)
             except Exception as e:
                 logging.warning(f"Erro ao processar {filename}: {e}")
+                continue
+            yield {"source": filename, "content": text}
+        return
+
+    janela = (max_workers or os.cpu_count() or 1) * 2
+    paginas_doc = []
+    source_atual = None
+    for pagina in _stream_pages(pool, folder_path, janela, PAGINAS_POR_TAREFA, arquivos):
+        if pagina["source"] != source_atual and paginas_doc:
+            yield {"source": source_atual, "content": "".join(paginas_doc)}
+            paginas_doc = []
+        source_atual = pagina["source"]
+        paginas_doc.append(pagina["content"])
+    if paginas_doc:
+        yield {"source": source_atual, "content": "".join(paginas_doc)}
+
+def _extract_text_parallel(folder_path, max_workers, arquivos):
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        # O pré-processamento de cada documento também roda no pool,
+        # enquanto as páginas dos próximos arquivos continuam sendo lidas.
+        futuros = [
+            (doc["source"], pool.submit(preprocess_text, doc["content"]))
+            for doc in iter_raw_documents(folder_path, pool, max_workers, arquivos)
+        ]
+        return [{"source": source, "content": futuro.result()} for source, futuro in futuros]
+
+def extract_text(folder_path, parallel=False, max_workers=None, arquivos=None):
+    """
+    Extrai texto de todos os arquivos PDF da pasta (ou só dos nomes em `arquivos`).
+    Retorna uma lista de dicionários com 'source' e 'content' (pré-processado).
+    Com parallel=True a leitura das páginas e o pré-processamento são
+    distribuídos entre processos.
+    """
+    if parallel:
+        return _extract_text_parallel(folder_path, max_workers, arquivos)
+
+    docs = []
+    for filename in _listar_pdfs(folder_path, arquivos):
+        file_path = os.path.join(folder_path, filename)
+        try:
+            with fitz.open(file_path) as pdf:
+                text = "".join(page.get_text() for page in pdf)
+                texto_preprocessado = preprocess_text(text)
+                docs.append({"source": filename, "content": texto_preprocessado})
+        except Exception as e:
+            logging.warning(f"Erro ao processar {filename}: {e}")
     return docs
 
 def chunking(docs, chunk_size=500, chunk_overlap=50):
@@ -70,12 +163,14 @@ def chunking(docs, chunk_size=500, chunk_overlap=50):
             })
     return chunked
 
-def save_jsonl(jsonl_path):
+def save_jsonl(chunks, jsonl_path):
+    """
+    Acrescenta os chunks ao corpus JSONL (com índice de offsets em `<arquivo>.idx`).
+    """
+    ChunkCorpus(jsonl_path).adicionar(chunks)
+
+def load_jsonl(jsonl_path):
     """
     Carrega os chunks salvos em um arquivo JSONL.
     """
-    chunks = []
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            chunks.append(json.loads(line.strip()))
-    return chunks
+    return list(ChunkCorpus(jsonl_path))
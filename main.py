@@ -1,13 +1,27 @@
 import logging
 import os
+import time
+import uuid
 import streamlit as st
-from langchain.memory import ConversationBufferMemory
-from chat.retriever_chain import build_retriever_chain
-from config import modelo_llm
-from db.mongo_client import armazenar_conversas
-from db.login import show_login_page
+from concurrent.futures import TimeoutError as FuturesTimeout
+from chat.answer_cache import SemanticAnswerCache
+from chat.ollama_llm import aquecimento
+from chat.retriever_chain import build_retriever_chain, gerar_resposta, preparar_resposta
+from chat.scheduler import FilaCheia, InferenceScheduler
+from chat.session_memory import SessionMemory
+from chat.streaming import CancelamentoHandler, MetricsCallbackHandler, StreamlitTokenHandler
+from config import (
+    modelo_llm, tempo_max_fila, tempo_max_resposta, emails_admin,
+    modo_armazenamento_conversas, colecao_buckets_conversas, escrita_assincrona, max_mensagens_sessao
+)
+from metricas import registrar_span, registro, turno
+from db.conexao import estatisticas_pool
+from db.indices import garantir_indices
+from db.mongo_client import armazenar_conversas, db
+from db.persistencia import PersistenciaConversas
+from db.login import carregar_historico, limitar_historico, show_login_page
+from documents.embedding_cache import get_query_embedding_model
 from dotenv import load_dotenv
-from visualization.graph import ChatbotMindMapGenerator
 
 # Configuração de logging
 logging.basicConfig(
@@ -29,17 +43,67 @@ if "user" not in st.session_state:
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 
-if "memory" not in st.session_state:
-    st.session_state.memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        input_key="question",
-        output_key="answer",
-        return_messages=True
-    )
+@st.cache_resource
+def init_indices():
+    # Cria/verifica os índices do MongoDB uma vez por processo
+    return garantir_indices(db)
+
+init_indices()
 
 @st.cache_resource(show_spinner="Carregando inteligência do chatbot...")
 def init_chain():
-    return build_retriever_chain(modelo_llm, memory=st.session_state.memory)
+    # Cadeia sem estado, compartilhada por todas as sessões
+    qa_chain = build_retriever_chain(modelo_llm)
+    registro.registrar_estatisticas("condensacao", qa_chain.question_generator.estatisticas)
+    return qa_chain
+
+@st.cache_resource
+def init_answer_cache():
+    answer_cache = SemanticAnswerCache(get_query_embedding_model())
+    # Acertos e latência economizada vão para o painel e para o arquivo do Prometheus
+    registro.registrar_estatisticas("cache_respostas", answer_cache.estatisticas)
+    return answer_cache
+
+@st.cache_resource
+def init_scheduler():
+    # Fila única do processo: limita as gerações simultâneas no Ollama
+    return InferenceScheduler()
+
+@st.cache_resource
+def init_persistencia():
+    # Grava as conversas em segundo plano, fora do caminho da resposta
+    persistencia = PersistenciaConversas()
+    registro.registrar_estatisticas("persistencia", persistencia.estatisticas)
+    return persistencia
+
+def aguardar(ticket, scheduler, placeholder, stream_handler, cancelamento):
+    """
+    Espera o resultado de um pedido na fila de inferência, exibindo a posição
+    na fila e, durante a geração, os tokens à medida que chegam.
+    """
+    while True:
+        try:
+            resultado = ticket.future.result(timeout=0.1)
+            break
+        except FuturesTimeout:
+            agora = time.monotonic()
+            if not ticket.iniciado:
+                if agora - ticket.enfileirado_em > tempo_max_fila and scheduler.cancelar(ticket):
+                    raise FilaCheia()
+                placeholder.info(f"⏳ Sua pergunta está na posição {scheduler.posicao(ticket)} da fila...")
+            elif agora - ticket.iniciado_em > tempo_max_resposta:
+                # Sem isso a geração abandonada continuaria ocupando o Ollama
+                cancelamento.cancelar()
+                raise TimeoutError(f"Resposta excedeu {tempo_max_resposta}s")
+            elif stream_handler.texto:
+                placeholder.markdown(stream_handler.texto + stream_handler.cursor)
+            else:
+                placeholder.markdown(stream_handler.cursor)
+    registrar_span("fila", ticket.iniciado_em - ticket.enfileirado_em)
+    return resultado
+
+MENSAGEM_ERRO = "Desculpe, ocorreu um erro interno. Tente reformular sua pergunta."
+MENSAGEM_OCUPADO = "Estamos com muitos acessos agora. Aguarde alguns instantes e envie sua pergunta novamente."
 
 # Lógica principal
 if not st.session_state.user:
@@ -53,47 +117,138 @@ else:
     if st.sidebar.button("Sair"):
         st.session_state.user = None
         st.session_state.chat_history = []
+        st.session_state.pop("historico_cursor", None)
+        st.session_state.pop("memory", None)
         st.rerun()
 
     qa_chain = init_chain()
+    answer_cache = init_answer_cache()
+    scheduler = init_scheduler()
+
+    # Memória da sessão, com orçamento de tokens, injetada na cadeia a cada pergunta
+    if "memory" not in st.session_state:
+        st.session_state.memory = SessionMemory()
+
+    # Exibição do histórico (paginado: só as mensagens já carregadas ficam na sessão)
+    if st.session_state.get("historico_cursor") and len(st.session_state.chat_history) < max_mensagens_sessao:
+        if st.button("Carregar mensagens anteriores"):
+            carregar_historico(st.session_state.historico_cursor)
+            st.rerun()
+    for msg in st.session_state.chat_history:
+        if msg["role"] == "user":
+            st.chat_message("user").write(msg["text"])
+        else:
+            st.chat_message("assistant").write(msg["text"])
 
     # Entrada do chat
     user_input = st.chat_input("Digite sua pergunta:")
 
     if user_input:
-        try:
-            st.session_state.chat_history.append({"role": "user", "text": user_input})
+        mensagem_usuario = {"role": "user", "text": user_input}
+        st.session_state.chat_history.append(mensagem_usuario)
+        st.chat_message("user").write(user_input)
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
 
-            response = qa_chain({
-                "question": user_input,
-                "chat_history": [msg["text"] for msg in st.session_state.chat_history]
-            })
+        # Spans de cada etapa do turno vão para o log JSON e para as métricas agregadas
+        with turno(usuario=st.session_state.user["id"]):
+            try:
+                stream_handler = StreamlitTokenHandler()
+                cancelamento = CancelamentoHandler()
+                callbacks = [stream_handler, MetricsCallbackHandler(), cancelamento]
 
-            if response and "answer" in response:
-                answer = response["answer"]
-                st.session_state.chat_history.append({"role": "bot", "text": answer})
+                def na_fila(funcao, *args, **kwargs):
+                    # Gerações da LLM rodam num worker da fila de inferência; esta thread acompanha
+                    ticket = scheduler.submeter(st.session_state.user["id"], funcao, *args, **kwargs)
+                    return aguardar(ticket, scheduler, placeholder, stream_handler, cancelamento)
 
-                armazenar_conversas(
-                    None,
-                    st.session_state.user["id"],
+                # Reescrita local, busca e cache de respostas rodam aqui, sem ocupar a fila
+                response = preparar_resposta(
+                    qa_chain,
                     user_input,
-                    answer
+                    st.session_state.memory.mensagens(),
+                    answer_cache=answer_cache,
+                    callbacks=callbacks,
+                    executar=na_fila
                 )
+                if "answer" not in response:
+                    response = na_fila(gerar_resposta, qa_chain, response, answer_cache=answer_cache, callbacks=callbacks)
 
-        except Exception as e:
-            logging.error("Erro ao gerar resposta: %s", str(e))
-            st.error("Desculpe, ocorreu um erro interno. Tente reformular sua pergunta.")
-            st.session_state.chat_history.append({
-                "role": "bot",
-                "text": "Desculpe, ocorreu um erro interno. Tente reformular sua pergunta."
-            })
-
-    # Exibição do histórico
-    for msg in st.session_state.chat_history:
-        if msg["role"] == "user":
-            st.chat_message("user").write(msg["text"])
-        else:
-            st.chat_message("assistant").write(msg["text"])
+                fila = scheduler.estatisticas()
+                logging.info(f"Fila de inferência: {fila}")
+                registro.definir_gauge("chat_fila_profundidade", fila["profundidade_fila"])
+                registro.definir_gauge("chat_fila_espera_p95_segundos", fila["espera_p95_s"])
+                pool = estatisticas_pool()
+                registro.definir_gauge("chat_mongo_conexoes_abertas", pool["conexoes_abertas"])
+                registro.definir_gauge("chat_mongo_conexoes_em_uso", pool["em_uso"])
+
+                if response and "answer" in response:
+                    answer = response["answer"]
+                    placeholder.markdown(answer)
+                    # O id do turno vai com as mensagens para o banco: limitar_historico acha a posição delas por ele
+                    turno_id = uuid.uuid4().hex
+                    mensagem_usuario["turno"] = turno_id
+                    st.session_state.chat_history.append({"role": "bot", "text": answer, "turno": turno_id})
+                    st.session_state.memory.adicionar(user_input, answer)
+                    if stream_handler.ttft is not None:
+                        st.session_state.ultimo_ttft = stream_handler.ttft
+
+                    if escrita_assincrona:
+                        init_persistencia().enfileirar(st.session_state.user["id"], user_input, answer, turno_id)
+                    elif not armazenar_conversas(
+                        None,
+                        st.session_state.user["id"],
+                        user_input,
+                        answer,
+                        turno_id
+                    ):
+                        # Turno não gravado: as mensagens podem sair da sessão sem virar cursor
+                        for mensagem in st.session_state.chat_history[-2:]:
+                            mensagem.pop("turno", None)
+
+            except FilaCheia:
+                placeholder.warning(MENSAGEM_OCUPADO)
+                st.session_state.chat_history.append({"role": "bot", "text": MENSAGEM_OCUPADO})
+
+            except Exception as e:
+                logging.error("Erro ao gerar resposta: %s", str(e))
+                placeholder.error(MENSAGEM_ERRO)
+                st.session_state.chat_history.append({
+                    "role": "bot",
+                    "text": MENSAGEM_ERRO
+                })
+
+        # Mantém o histórico da sessão limitado; as mensagens descartadas continuam no banco
+        limitar_historico()
+
+    if st.session_state.get("ultimo_ttft") is not None:
+        st.sidebar.caption(f"Tempo até o primeiro token: {st.session_state.ultimo_ttft:.2f}s")
+    if aquecimento["concluido"]:
+        st.sidebar.caption(f"Cold start do modelo: {aquecimento['segundos']:.1f}s")
+    fila = scheduler.estatisticas()
+    st.sidebar.caption(
+        f"Fila de inferência: {fila['profundidade_fila']} aguardando, "
+        f"espera p95 {fila['espera_p95_s']:.1f}s"
+    )
+
+    # Painel de métricas para administradores: percentis recentes de cada etapa
+    if st.session_state.user.get("email") in emails_admin:
+        with st.sidebar.expander("Métricas de latência"):
+            percentis = registro.percentis()
+            if percentis:
+                st.table({
+                    etapa: {nome: f"{valor * 1000:.0f} ms" for nome, valor in quantis.items()}
+                    for etapa, quantis in sorted(percentis.items())
+                })
+            else:
+                st.caption("Nenhum turno registrado ainda.")
+            pool = estatisticas_pool()
+            st.caption(
+                f"MongoDB: {pool['conexoes_abertas']} conexões abertas, {pool['em_uso']} em uso, "
+                f"handshake médio {pool['handshake_medio_s'] * 1000:.0f} ms"
+            )
+            for nome, valores in sorted(registro.estatisticas().items()):
+                st.caption(f"{nome}: " + ", ".join(f"{chave} {valor}" for chave, valor in valores.items()))
 
     st.markdown("---")
 
@@ -106,11 +261,13 @@ else:
             if not mongo_uri:
                 st.error("Erro: MONGO_URI não encontrada")
                 st.stop()
-                
+
+            # Importado só aqui: spaCy, sklearn, seaborn e matplotlib pesam na inicialização do app
+            from visualization.graph import ChatbotMindMapGenerator
             mindmap_generator = ChatbotMindMapGenerator(
                 mongo_uri=mongo_uri,
                 database_name="chat_bot",
-                collection_name="conversas"
+                collection_name=colecao_buckets_conversas if modo_armazenamento_conversas == "buckets" else "conversas"
             )
             
             # Update to unpack 4 values instead of 3
@@ -0,0 +1,198 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+from config import arquivo_log_metricas, arquivo_metricas_prometheus, janela_metricas
+
+_turno_atual = contextvars.ContextVar("turno_atual", default=None)
+
+class Registro:
+    """
+    Agrega os spans de todos os turnos do processo: janela deslizante de
+    durações por etapa (para percentis), somas e contagens acumuladas, tokens,
+    hits/misses de cache, gauges avulsos (ex.: profundidade da fila) e
+    estatísticas de componentes lidas na hora da exportação.
+    """
+
+    def __init__(self, janela: int = janela_metricas):
+        self._duracoes = defaultdict(lambda: deque(maxlen=janela))
+        self._soma = defaultdict(float)
+        self._contagem = defaultdict(int)
+        self._tokens = defaultdict(int)
+        self._cache = defaultdict(int)
+        self._gauges = {}
+        self._fontes = {}
+        self._lock = threading.Lock()
+
+    def adicionar(self, span: dict):
+        etapa = span["etapa"]
+        with self._lock:
+            self._duracoes[etapa].append(span["duracao_s"])
+            self._soma[etapa] += span["duracao_s"]
+            self._contagem[etapa] += 1
+            for chave in ("tokens_prompt", "tokens_gerados"):
+                if span.get(chave):
+                    self._tokens[(etapa, chave)] += span[chave]
+            if "cache_hit" in span:
+                self._cache[(etapa, "hit" if span["cache_hit"] else "miss")] += 1
+
+    def definir_gauge(self, nome: str, valor: float):
+        with self._lock:
+            self._gauges[nome] = valor
+
+    def registrar_estatisticas(self, nome: str, funcao: Callable[[], dict]):
+        """
+        Registra um componente cujas estatísticas (dict de números) são exportadas
+        como gauges chat_<nome>_<chave> (ex.: o cache de respostas).
+        """
+        with self._lock:
+            self._fontes[nome] = funcao
+
+    def estatisticas(self) -> Dict[str, dict]:
+        """
+        Estatísticas atuais de cada componente registrado.
+        """
+        with self._lock:
+            fontes = dict(self._fontes)
+        resultado = {}
+        for nome, funcao in fontes.items():
+            try:
+                resultado[nome] = funcao()
+            except Exception as e:
+                logging.warning(f"Falha ao ler as estatísticas de '{nome}': {e}")
+        return resultado
+
+    def percentis(self, quantis=(0.5, 0.95, 0.99)) -> Dict[str, Dict[str, float]]:
+        """
+        Percentis (em segundos) da janela recente de cada etapa.
+        """
+        with self._lock:
+            janelas = {etapa: sorted(valores) for etapa, valores in self._duracoes.items() if valores}
+        return {
+            etapa: {f"p{int(q * 100)}": valores[min(int(len(valores) * q), len(valores) - 1)] for q in quantis}
+            for etapa, valores in janelas.items()
+        }
+
+    def exportar_prometheus(self) -> str:
+        """
+        Métricas no formato texto do Prometheus.
+        """
+        estatisticas = self.estatisticas()
+        linhas = [
+            "# HELP chat_etapa_segundos Duração das etapas de um turno do chat.",
+            "# TYPE chat_etapa_segundos summary",
+        ]
+        for etapa, quantis in self.percentis().items():
+            for nome, valor in quantis.items():
+                linhas.append(f'chat_etapa_segundos{{etapa="{etapa}",quantile="{int(nome[1:]) / 100:g}"}} {valor:.6f}')
+        with self._lock:
+            for etapa in self._contagem:
+                linhas.append(f'chat_etapa_segundos_sum{{etapa="{etapa}"}} {self._soma[etapa]:.6f}')
+                linhas.append(f'chat_etapa_segundos_count{{etapa="{etapa}"}} {self._contagem[etapa]}')
+            linhas += ["# HELP chat_tokens_total Tokens processados pela LLM.", "# TYPE chat_tokens_total counter"]
+            for (etapa, tipo), total in sorted(self._tokens.items()):
+                linhas.append(f'chat_tokens_total{{etapa="{etapa}",tipo="{tipo}"}} {total}')
+            linhas += ["# HELP chat_cache_total Consultas aos caches por resultado.", "# TYPE chat_cache_total counter"]
+            for (etapa, resultado), total in sorted(self._cache.items()):
+                linhas.append(f'chat_cache_total{{cache="{etapa}",resultado="{resultado}"}} {total}')
+            for nome, valor in sorted(self._gauges.items()):
+                linhas += [f"# TYPE {nome} gauge", f"{nome} {valor}"]
+        for fonte, valores in sorted(estatisticas.items()):
+            for chave, valor in sorted(valores.items()):
+                if isinstance(valor, (int, float)):
+                    # Booleanos viram 0/1 (o formato do Prometheus só aceita números)
+                    linhas += [f"# TYPE chat_{fonte}_{chave} gauge", f"chat_{fonte}_{chave} {int(valor) if isinstance(valor, bool) else valor}"]
+        return "\n".join(linhas) + "\n"
+
+    def salvar_prometheus(self, caminho: str = arquivo_metricas_prometheus):
+        """
+        Grava as métricas para o textfile collector do node_exporter (escrita atômica).
+        """
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        temporario = caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(self.exportar_prometheus())
+        os.replace(temporario, caminho)
+
+registro = Registro()
+
+class Turno:
+    """
+    Spans de um turno do chat. Cada span é um dict com etapa, início relativo,
+    duração e atributos (tokens, cache_hit...). Spans que chegam depois de
+    finalizar() (ex.: de uma geração abandonada por timeout) são descartados.
+    """
+
+    def __init__(self, **atributos: Any):
+        self.atributos = atributos
+        self.inicio = time.perf_counter()
+        self.spans: List[dict] = []
+        self.finalizado = False
+        self._lock = threading.Lock()
+
+    def registrar(self, etapa: str, duracao: float, inicio: float = None, **atributos: Any):
+        inicio = time.perf_counter() - duracao if inicio is None else inicio
+        with self._lock:
+            if self.finalizado:
+                return
+            self.spans.append(dict(
+                etapa=etapa, inicio_s=round(inicio - self.inicio, 6), duracao_s=duracao, **atributos
+            ))
+
+    def finalizar(self) -> dict:
+        with self._lock:
+            self.finalizado = True
+        evento = dict(self.atributos, duracao_s=time.perf_counter() - self.inicio, spans=self.spans)
+        for span in self.spans:
+            registro.adicionar(span)
+        registro.adicionar({"etapa": "turno", "duracao_s": evento["duracao_s"]})
+        try:
+            os.makedirs(os.path.dirname(arquivo_log_metricas) or ".", exist_ok=True)
+            with open(arquivo_log_metricas, "a", encoding="utf-8") as f:
+                f.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+            registro.salvar_prometheus()
+        except OSError as e:
+            logging.warning(f"Falha ao gravar métricas do turno: {e}")
+        return evento
+
+@contextmanager
+def turno(**atributos: Any):
+    """
+    Abre um turno: spans registrados nesta thread (ou em threads que copiem o
+    contexto, como a fila de inferência) entram nele. Ao sair, o turno vai para
+    o log JSON e para as métricas agregadas.
+    """
+    atual = Turno(**atributos)
+    token = _turno_atual.set(atual)
+    try:
+        yield atual
+    finally:
+        _turno_atual.reset(token)
+        atual.finalizar()
+
+def registrar_span(etapa: str, duracao: float, **atributos: Any):
+    """
+    Registra um span já medido no turno atual (sem turno aberto, vai direto ao registro).
+    """
+    atual = _turno_atual.get()
+    if atual is not None:
+        atual.registrar(etapa, duracao, **atributos)
+    else:
+        registro.adicionar(dict(etapa=etapa, duracao_s=duracao, **atributos))
+
+@contextmanager
+def span(etapa: str, **atributos: Any):
+    """
+    Mede o bloco como um span da etapa. Atributos podem ser completados dentro
+    do bloco pelo dict devolvido (ex.: attrs["cache_hit"] = True).
+    """
+    inicio = time.perf_counter()
+    try:
+        yield atributos
+    finally:
+        registrar_span(etapa, time.perf_counter() - inicio, **atributos)
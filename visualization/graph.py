@@ -1,55 +1,89 @@
 import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
-from pymongo import MongoClient
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import re
 from datetime import datetime, timedelta
 from collections import Counter
 import streamlit as st
-import nltk
-import spacy
 import difflib
 import seaborn as sns
 from matplotlib.patches import FancyBboxPatch
 import matplotlib.patches as mpatches
+from functools import lru_cache
+from documents.normalizer import carregar_stopwords
+from config import modo_armazenamento_conversas
+from db.conexao import get_client
 
-nltk.download("stopwords")
-from nltk.corpus import stopwords
+@lru_cache(maxsize=None)
+def get_nlp():
+    """
+    Modelo de linguagem do spaCy, carregado uma única vez no primeiro uso.
+    """
+    import spacy
+    return spacy.load("pt_core_news_sm")
 
-# Carregando modelo de linguagem do spaCy
-nlp = spacy.load("pt_core_news_sm")
-
-# Stopwords personalizadas (pode ajustar conforme necessário)
-CUSTOM_STOPWORDS = set(stopwords.words("portuguese")).union({
-    "me", "minha", "qual", "mais", "foi", "última", "sobre", "pergunta", "contra", "minhas", "vez", "vezes"
-})
+@lru_cache(maxsize=None)
+def get_custom_stopwords():
+    # Stopwords personalizadas (pode ajustar conforme necessário)
+    return set(carregar_stopwords("portuguese")).union({
+        "me", "minha", "qual", "mais", "foi", "última", "sobre", "pergunta", "contra", "minhas", "vez", "vezes"
+    })
 
 class ChatbotMindMapGenerator:
-    def __init__(self, mongo_uri: str, database_name: str, collection_name: str):
-        """Initialize the ChatbotMindMapGenerator with MongoDB connection parameters."""
-        self.client = MongoClient(mongo_uri)
+    def __init__(self, database_name: str, collection_name: str, mongo_uri: str = None):
+        """Initialize the ChatbotMindMapGenerator using the process-wide MongoDB client."""
+        self.client = get_client(mongo_uri)
         self.db = self.client[database_name]
         self.collection = self.db[collection_name]
-        self.stop_words = set(stopwords.words("portuguese"))
+        self.stop_words = set(carregar_stopwords("portuguese"))
+
+    def fetch_bucket_messages(self, usuario_id, date_filter, limit=1000):
+        """Busca as mensagens do usuário só nos buckets que cobrem o período, dos mais recentes para os mais antigos."""
+        mensagens_usuario = []
+        buckets = self.collection.find(
+            {"cod": usuario_id, "fim": {"$gte": date_filter}},
+            {"mensagens": 1}
+        ).sort("fim", -1)
+        for bucket in buckets:
+            for msg in reversed(bucket.get("mensagens", [])):
+                if (msg.get("tipo") == "usuario" and "texto" in msg and
+                        msg.get("timestamp", datetime.now()) >= date_filter):
+                    mensagens_usuario.append({"text": msg["texto"]})
+                if len(mensagens_usuario) >= limit:
+                    return mensagens_usuario
+        return mensagens_usuario
+
+    def fetch_document_messages(self, collection, usuario_id, date_filter, limit=1000, filtro_extra=None):
+        """Busca as mensagens do usuário no documento único por usuário (formato antigo)."""
+        conversa = collection.find_one(dict({
+            "cod": usuario_id,
+            "mensagens": {"$elemMatch": {"timestamp": {"$gte": date_filter}}}
+        }, **(filtro_extra or {})))
+        mensagens_usuario = []
+        if conversa and "mensagens" in conversa:
+            for msg in conversa["mensagens"]:
+                if (msg.get("tipo") == "usuario" and "texto" in msg and 
+                    msg.get("timestamp", datetime.now()) >= date_filter):
+                    mensagens_usuario.append({"text": msg["texto"]})
+                if len(mensagens_usuario) >= limit:
+                    break
+        return mensagens_usuario
 
     def fetch_chatbot_messages(self, usuario_id, limit=1000, days_back=30):
         try:
             date_filter = datetime.now() - timedelta(days=days_back)
-            conversa = self.collection.find_one({
-                "cod": usuario_id,
-                "mensagens": {"$elemMatch": {"timestamp": {"$gte": date_filter}}}
-            })
-            mensagens_usuario = []
-            if conversa and "mensagens" in conversa:
-                for msg in conversa["mensagens"]:
-                    if (msg.get("tipo") == "usuario" and "texto" in msg and 
-                        msg.get("timestamp", datetime.now()) >= date_filter):
-                        mensagens_usuario.append({"text": msg["texto"]})
-                    if len(mensagens_usuario) >= limit:
-                        break
-            return mensagens_usuario
+            if modo_armazenamento_conversas == "buckets":
+                mensagens_usuario = self.fetch_bucket_messages(usuario_id, date_filter, limit)
+                if len(mensagens_usuario) < limit:
+                    # Conversas ainda não migradas continuam na coleção antiga
+                    mensagens_usuario += self.fetch_document_messages(
+                        self.db["conversas"], usuario_id, date_filter, limit - len(mensagens_usuario),
+                        filtro_extra={"migrado_buckets": {"$ne": True}}
+                    )
+                return mensagens_usuario
+            return self.fetch_document_messages(self.collection, usuario_id, date_filter, limit)
         except Exception as e:
             print(f"Erro ao buscar mensagens: {e}")
             return []
@@ -63,11 +97,13 @@ class ChatbotMindMapGenerator:
     def preprocess_and_extract_keywords(self, mensagens, top_n=30):
         documentos = [msg["text"] for msg in mensagens if "text" in msg]
         palavras_filtradas = []
+        nlp = get_nlp()
+        custom_stopwords = get_custom_stopwords()
         for doc in documentos:
             doc_spacy = nlp(doc.lower())
             palavras_doc = [
                 token.lemma_ for token in doc_spacy
-                if token.is_alpha and token.lemma_ not in CUSTOM_STOPWORDS and token.pos_ in {"NOUN", "VERB"}
+                if token.is_alpha and token.lemma_ not in custom_stopwords and token.pos_ in {"NOUN", "VERB"}
             ]
             palavras_filtradas.append(" ".join(palavras_doc))
 